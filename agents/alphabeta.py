@@ -0,0 +1,306 @@
+import math
+import time
+
+from environment import endgame
+from environment.quoridor import BLOCKERS, NEIGHBOURS, PAWN_DELTAS
+
+from .base import BaseAgent
+
+# Scores are from the point of view of the player to move. A win is worth
+# more than any distance difference, less the plies it takes to get there.
+WIN = 1000
+
+# Scores beyond this are wins or losses. The transposition table holds them
+# as plies from the node rather than from the root, so a position reached
+# at another ply reads back the right score.
+DECIDED = WIN // 2
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def _to_table(score, ply):
+    if score > DECIDED:
+        return score + ply
+    if score < -DECIDED:
+        return score - ply
+    return score
+
+
+def _from_table(score, ply):
+    if score > DECIDED:
+        return score - ply
+    if score < -DECIDED:
+        return score + ply
+    return score
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class AlphaBetaAgent(BaseAgent):
+    """Negamax alpha-beta search with iterative deepening.
+
+    Searches a clone of the environment with push / pop until time_limit
+    seconds run out, then plays the best move of the deepest search that
+    finished. Positions are scored by the difference between the players'
+    distances to their goals.
+
+    Moves are ordered by the transposition table's best move, then pawn
+    moves by how close they get to the goal, then walls on the opponent's
+    shortest path by how much they lengthen it. Every other wall is only
+    searched at the root. Below the root, wall legality is checked with the
+    engine's distance maps as walls are played, rather than generating the
+    legality of every wall at every node. Positions where neither player has
+    walls left are scored exactly from the endgame tables (see
+    environment.endgame), and are not searched at all at the root.
+    """
+
+    def __init__(self, name, environment=None, time_limit=1.0, max_depth=32, table_size=2 ** 20):
+        super().__init__(name, environment)
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.table_size = table_size
+
+        # Zobrist hash -> (depth, score, flag, best move)
+        self._table = {}
+        # Zobrist hash -> ordered moves, for nodes searched to depth 2 or more
+        self._moves = {}
+        self.nodes = 0
+        self.depth = 0
+        # Best move of the deepest finished iteration of the current search
+        self.best_action = None
+        self._stopped = False
+
+    def choose_action(self):
+        return self._search(self.time_limit)
+
+    def ponder(self):
+        """Searches deeper and deeper until stopped, filling the transposition table."""
+        self._search(math.inf)
+
+    def stop(self):
+        self._stopped = True
+
+    def _search(self, time_limit):
+        game = self.environment.clone()
+        # The search keeps its own transposition table
+        game.cache = None
+
+        if len(self._table) > self.table_size:
+            self._table.clear()
+            self._moves.clear()
+
+        self.nodes = 0
+        self.depth = 0
+        self.best_action = None
+        self._stopped = False
+
+        # Once neither player has walls left the endgame table has the answer
+        best_action = endgame.best_action(game)
+        if best_action is not None:
+            self.best_action = best_action
+            return best_action
+
+        self._deadline = time.perf_counter() + time_limit
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, action = self._search_root(game, depth)
+            except SearchTimeout:
+                # Back to the root, the clone started with no history
+                while game._history:
+                    game.pop()
+                break
+            best_action = action
+            self.best_action = action
+            self.depth = depth
+            # No point searching deeper once the result is decided
+            if abs(score) >= WIN - self.max_depth:
+                break
+
+        if best_action is None:
+            # Not even one ply finished, fall back on the best pawn move
+            best_action = self._ordered_moves(game, 1)[0]
+        return best_action
+
+    def _search_root(self, game, depth):
+        alpha = -WIN - 1
+        best_action = None
+        moves = self._ordered_moves(game, depth, root=True)
+        # The previous iteration's best move first
+        entry = self._table.get(game.zobrist_hash)
+        if entry is not None and entry[3] in moves:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+
+        for action in moves:
+            score = self._child_score(game, action, depth, alpha, WIN + 1, 0)
+            if score > alpha:
+                alpha = score
+                best_action = action
+        self._table[game.zobrist_hash] = (depth, alpha, EXACT, best_action)
+        return alpha, best_action
+
+    def _child_score(self, game, action, depth, alpha, beta, ply):
+        """The score of a move for the player making it, None if it's illegal."""
+        _, done = game.push(action)
+        if action >= 12 and (game.distance(1) is None or game.distance(2) is None):
+            game.pop()
+            return None
+        if done:
+            score = WIN - ply - 1
+        else:
+            score = -self._negamax(game, depth - 1, -beta, -alpha, ply + 1)
+        game.pop()
+        return score
+
+    def _negamax(self, game, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self._stopped or time.perf_counter() > self._deadline:
+            raise SearchTimeout
+
+        if not game._player1_walls_remaining and not game._player2_walls_remaining:
+            # Solving a new wall layout costs about as much as a couple of
+            # plies of search, so shallower nodes only use tables already
+            # solved
+            score = self._endgame_score(game, ply, solve_missing=depth >= 2)
+            if score is not None:
+                return score
+
+        if depth == 0:
+            return self._evaluate(game)
+
+        key = game.zobrist_hash
+        entry = self._table.get(key)
+        best_move = None
+        if entry is not None:
+            entry_depth, score, flag, best_move = entry
+            score = _from_table(score, ply)
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return score
+                if flag == LOWER and score >= beta:
+                    return score
+                if flag == UPPER and score <= alpha:
+                    return score
+
+        original_alpha = alpha
+        best_score = -WIN - 1
+        moves = self._ordered_moves(game, depth)
+        if best_move in moves:
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+
+        for action in moves:
+            score = self._child_score(game, action, depth, alpha, beta, ply)
+            if score is None:
+                continue
+            if score > best_score:
+                best_score = score
+                best_move = action
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self._table[key] = (depth, _to_table(best_score, ply), flag, best_move)
+        return best_score
+
+    def _endgame_score(self, game, ply, solve_missing=True):
+        """The exact score of a pawn race, on the same scale as wins found by search.
+
+        None if the wall layout isn't solved and solve_missing is False.
+        """
+        probed = endgame.probe(game, solve_missing)
+        if probed is None:
+            return None
+        result, plies = probed
+        if result == endgame.WIN:
+            return WIN - ply - plies
+        if result == endgame.LOSS:
+            return ply + plies - WIN
+        return 0
+
+    def _evaluate(self, game):
+        player = game.current_player
+        opponent = 1 if player == 2 else 2
+        return game.distance(opponent) - game.distance(player)
+
+    def _ordered_moves(self, game, depth, root=False):
+        """Moves to search, best first.
+
+        At the root every move is legal. Below it, walls only fit the board
+        and may still cut a player off, which _child_score checks.
+        """
+        key = game.zobrist_hash
+        if not root and key in self._moves:
+            return self._moves[key].copy()
+
+        player = game.current_player
+        opponent = 1 if player == 2 else 2
+        location = game._positions[player]
+        if root:
+            legal = game.legal_mask()
+            pawn_actions = [action for action in range(12) if legal[action]]
+        else:
+            pawn_actions = game._valid_pawn_actions(game._intersections, location, game._positions[opponent], player)
+
+        # Pawn moves, closest to the goal first. Jumping off the board wins.
+        distances = game._distance_list(player)
+        pawn_moves = []
+        for action in pawn_actions:
+            target = location + PAWN_DELTAS[action]
+            pawn_moves.append((distances[target] if 0 <= target < 81 else -1, action))
+        pawn_moves.sort()
+        moves = [action for _, action in pawn_moves]
+
+        walls_remaining = game._player1_walls_remaining if player == 1 else game._player2_walls_remaining
+        if walls_remaining == 0:
+            return moves
+
+        path_walls = [wall for wall in dict.fromkeys(self._path_walls(game, opponent))
+                      if (legal[wall] if root else game._wall_fits((wall - 12) % 64, 1 if wall < 76 else -1))]
+        if depth >= 2:
+            # Walls on the opponent's shortest path, by how much longer they
+            # make it. Leaves score them anyway, so only sort above them.
+            opponent_distance = game.distance(opponent)
+            lengthened = []
+            for wall in path_walls:
+                game.push(wall)
+                distance = game.distance(opponent)
+                if distance is not None and game.distance(player) is not None and distance > opponent_distance:
+                    lengthened.append((opponent_distance - distance, wall))
+                game.pop()
+            lengthened.sort()
+            path_walls = [wall for _, wall in lengthened]
+        moves.extend(path_walls)
+
+        if root:
+            searched = set(moves)
+            moves.extend(wall for wall in range(12, 140) if legal[wall] and wall not in searched)
+        elif depth >= 2:
+            self._moves[key] = moves.copy()
+        return moves
+
+    def _path_walls(self, game, player):
+        """Wall actions closing an edge of one of the player's shortest paths."""
+        distances = game._distance_list(player)
+        walls = game._intersections
+        tile = game._positions[player]
+        path_walls = []
+        while 0 <= tile < 81 and distances[tile] > 0:
+            for direction, neighbour in enumerate(NEIGHBOURS[tile]):
+                if (neighbour >= 0 and distances[neighbour] == distances[tile] - 1
+                    and game._edge_open(walls, tile, direction)):
+                    break
+            # Walls on the board's 8x8 grid that would close this edge
+            for intersection, orientation in BLOCKERS[tile][direction]:
+                path_walls.append(12 + intersection + (0 if orientation == 1 else 64))
+            tile = neighbour
+        return path_walls
@@ -7,8 +7,17 @@ class BaseAgent:
         self.environment = environment
 
     def choose_action(self):
-        action = np.random.choice(self.environment.valid_actions)
-        pawn_actions = [a for a in self.environment.valid_actions if a < 12]
-        action = action = np.random.choice(pawn_actions)
-        print(f"Choosing action {action}")
-        return action
+        # Pawn moves only, so no wall legality needs to be generated
+        pawn_actions = [a for a in range(12) if self.environment.is_legal(a)]
+        return np.random.choice(pawn_actions)
+
+    def ponder(self):
+        """Searches the current position on the opponent's time, until stop is called.
+
+        Agents that don't search do nothing.
+        """
+        pass
+
+    def stop(self):
+        """Asks a choose_action or ponder running on another thread to finish early."""
+        pass
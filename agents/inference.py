@@ -0,0 +1,230 @@
+"""Batched inference for many concurrent games.
+
+Games and search agents submit positions to an InferenceServer from their
+own coroutines. The server gathers them into batches for one model call
+each. Run as
+
+    python -m agents.inference --batch-sizes 1 8 32 128
+
+to measure positions per second at each maximum batch size with the NumPy
+stand-in model.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from environment.bitboard import BitboardQuoridor
+from environment.encoder import N_PLANES, encode_state
+
+
+class LinearModel:
+    """A stand-in for a policy / value network: one hidden ReLU layer with random weights.
+
+    Models are called with states (n, 25, 9, 9) and return policy logits
+    (n, 140) and values (n,), from the point of view of the player to move.
+    """
+
+    def __init__(self, hidden=256, seed=0):
+        rng = np.random.default_rng(seed)
+        inputs = N_PLANES * 81
+        self.hidden = rng.normal(0, inputs ** -0.5, [inputs, hidden]).astype(np.float32)
+        self.policy = rng.normal(0, hidden ** -0.5, [hidden, 140]).astype(np.float32)
+        self.value = rng.normal(0, hidden ** -0.5, hidden).astype(np.float32)
+
+    def __call__(self, states):
+        hidden = np.maximum(states.reshape(len(states), -1) @ self.hidden, 0)
+        return hidden @ self.policy, np.tanh(hidden @ self.value)
+
+
+def masked_softmax(logits, legal_masks):
+    """Softmax over the legal actions of each row, illegal actions get 0."""
+    logits = np.where(legal_masks, logits, -np.inf)
+    logits -= logits.max(axis=1, keepdims=True)
+    policies = np.exp(logits)
+    policies /= policies.sum(axis=1, keepdims=True)
+    return policies
+
+
+class InferenceServer:
+    """Collects evaluation requests into batches for a model.
+
+    A batch is sent once max_batch_size requests are waiting, or timeout
+    seconds after its first request arrived. The model runs on a worker
+    thread, so clients can keep queueing positions while it does. Use as
+
+        async with InferenceServer(model) as server:
+            policy, value = await server.evaluate(state, legal_mask)
+    """
+
+    def __init__(self, model, max_batch_size=64, timeout=0.001, dtype=np.float32):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+
+        self._states = np.zeros([max_batch_size, N_PLANES, 9, 9], dtype=dtype)
+        self._legal_masks = np.zeros([max_batch_size, 140], dtype=np.bool_)
+        self._queue = None
+        self._task = None
+        self._executor = None
+
+        self.batches = 0
+        self.positions = 0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def start(self):
+        """Starts serving on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(1)
+        self._task = asyncio.get_running_loop().create_task(self._serve())
+
+    async def stop(self):
+        """Stops serving, requests still waiting are cancelled."""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            future.cancel()
+        self._executor.shutdown()
+
+    async def evaluate(self, state, legal_mask):
+        """The policy over legal actions and the value of one position."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((state, legal_mask, future))
+        return await future
+
+    async def evaluate_many(self, states, legal_masks):
+        """Policies (n, 140) and values (n,) of a batch of positions.
+
+        Each position is queued separately, so they may share model calls
+        with other clients' positions.
+        """
+        results = await asyncio.gather(*(self.evaluate(state, mask) for state, mask in zip(states, legal_masks)))
+        return np.array([policy for policy, _ in results]), np.array([value for _, value in results])
+
+    @property
+    def mean_batch_size(self):
+        return self.positions / self.batches if self.batches else 0.0
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.timeout
+            while len(batch) < self.max_batch_size:
+                if queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(queue.get_nowait())
+
+            n = len(batch)
+            for i, (state, legal_mask, _) in enumerate(batch):
+                self._states[i] = state
+                self._legal_masks[i] = legal_mask
+            try:
+                policies, values = await loop.run_in_executor(self._executor, self._run_model, n)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.positions += n
+            for i, (_, _, future) in enumerate(batch):
+                # The client may have given up waiting
+                if not future.done():
+                    future.set_result((policies[i], float(values[i])))
+
+    def _run_model(self, n):
+        logits, values = self.model(self._states[:n])
+        return masked_softmax(logits, self._legal_masks[:n]), values
+
+
+def sample_positions(n, seed=0):
+    """States and legal masks of n positions from random games."""
+    rng = random.Random(seed)
+    states = np.zeros([n, N_PLANES, 9, 9], dtype=np.float32)
+    legal_masks = np.zeros([n, 140], dtype=np.bool_)
+    game = BitboardQuoridor()
+    for i in range(n):
+        encode_state(game, states[i])
+        game.legal_mask(out=legal_masks[i])
+        actions = np.flatnonzero(legal_masks[i]).tolist()
+        _, done = game.push(rng.choice(actions))
+        if done:
+            game.reset()
+    return states, legal_masks
+
+
+async def _client(server, states, legal_masks, offset, deadline):
+    evaluated = 0
+    i = offset
+    while time.perf_counter() < deadline:
+        await server.evaluate(states[i], legal_masks[i])
+        evaluated += 1
+        i = (i + 1) % len(states)
+    return evaluated
+
+
+async def measure(model, max_batch_size, clients=256, seconds=1.0, timeout=0.001, positions=1024):
+    """Positions per second with clients concurrently evaluating positions one at a time."""
+    states, legal_masks = sample_positions(positions)
+    async with InferenceServer(model, max_batch_size, timeout) as server:
+        start = time.perf_counter()
+        counts = await asyncio.gather(*(_client(server, states, legal_masks, offset, start + seconds)
+                                        for offset in range(clients)))
+        elapsed = time.perf_counter() - start
+    return {
+        'positions_per_second': sum(counts) / elapsed,
+        'mean_batch_size': server.mean_batch_size,
+        'batches': server.batches,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--clients', type=int, default=256, help="concurrent clients submitting positions")
+    parser.add_argument('--seconds', type=float, default=1.0, help="time spent at each batch size")
+    parser.add_argument('--timeout', type=float, default=0.001, help="seconds to wait to fill a batch")
+    parser.add_argument('--hidden', type=int, default=256, help="hidden units of the stand-in model")
+    parser.add_argument('--output', help="JSON results file (default stdout)")
+    args = parser.parse_args(argv)
+
+    model = LinearModel(args.hidden)
+    results = {batch_size: asyncio.run(measure(model, batch_size, args.clients, args.seconds, args.timeout))
+               for batch_size in args.batch_sizes}
+
+    report = json.dumps({'clients': args.clients, 'timeout': args.timeout, 'batch_sizes': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,7 +9,7 @@ class ManualCLIAgent(BaseAgent):
         valid = self.environment.actions
         print(valid)
         action = int(input("Choose Action: "))
-        while action not in valid:
+        while not self.environment.is_legal(action):
             print (f"Invalid Action: {action} - please select a valid action")
             print(valid)
             action = int(input("Choose Action: "))
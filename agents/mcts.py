@@ -0,0 +1,344 @@
+import math
+import time
+
+import numpy as np
+
+from environment import endgame
+from environment.bitboard import BitboardQuoridor
+from environment.encoder import N_PLANES, StateEncoder
+from environment.quoridor import Quoridor
+
+from .base import BaseAgent
+
+# Tree nodes live in parallel arrays indexed by node id. The children of a
+# node are allocated together, so they are the ids first_child to
+# first_child + n_children - 1. A node's value is from the point of view of
+# the player who made the move leading to it.
+NODE_FIELDS = (
+    ('parent', np.int32),
+    ('action', np.int16),
+    ('first_child', np.int32),  # -1 until the node is expanded
+    ('n_children', np.int16),
+    ('visits', np.int32),  # real visits plus virtual losses in flight
+    ('value_sum', np.float32),
+    ('prior', np.float32),
+)
+
+
+class DistanceEvaluator:
+    """A stand-in evaluator that needs no model.
+
+    Values come from the difference between the players' distances to their
+    goals, with the player to move half a step ahead. Priors are spread
+    evenly, with pawn_share of the probability on pawn moves when there are
+    walls to place too.
+
+    Any evaluator is called with a batch of states (n, 25, 9, 9) and legal
+    masks (n, 140), and returns priors (n, 140) and values (n,) in [-1, 1],
+    both from the point of view of the player to move.
+    """
+
+    def __init__(self, scale=3.0, pawn_share=0.5):
+        self.scale = scale
+        self.pawn_share = pawn_share
+        self._game = Quoridor()
+
+    def __call__(self, states, legal_masks):
+        game = self._game
+        values = np.empty(len(states), dtype=np.float32)
+        for i, state in enumerate(states):
+            game.load_state(state)
+            player = game.current_player
+            opponent = 1 if player == 2 else 2
+            values[i] = math.tanh((game.distance(opponent) - game.distance(player) + 0.5) / self.scale)
+
+        priors = legal_masks.astype(np.float32)
+        n_pawn = priors[:, :12].sum(axis=1, keepdims=True)
+        n_wall = priors[:, 12:].sum(axis=1, keepdims=True)
+        pawn_share = np.where(n_wall > 0, self.pawn_share, 1.0)
+        priors[:, :12] *= pawn_share / np.maximum(n_pawn, 1)
+        priors[:, 12:] *= (1 - pawn_share) / np.maximum(n_wall, 1)
+        return priors, values
+
+
+class MCTSAgent(BaseAgent):
+    """PUCT Monte Carlo tree search with batched leaf evaluation.
+
+    Each round selects up to batch_size leaves, applying a virtual loss
+    along each path so later selections in the round spread out, then
+    evaluates them in one call to the evaluator (see DistanceEvaluator).
+    Positions are not stored in the tree: each selection replays its path
+    on a copy of a bitboard engine (see environment.bitboard) at the root.
+
+    The tree is kept between moves. When the environment has moved on from
+    the last search's root, the agent follows the moves played into the
+    subtree it already has and compacts the arrays around it.
+
+    Searches stop after simulations leaves, or time_limit seconds if given,
+    whichever comes first, and play the most visited move. Once neither
+    player has walls left, leaves take their exact value from the endgame
+    table (see environment.endgame) and the table picks the move played.
+    """
+
+    def __init__(self, name, environment=None, evaluator=None, simulations=800, batch_size=8, c_puct=1.5,
+                 virtual_loss=1, time_limit=None, max_nodes=2 ** 19):
+        # Room for the root and one batch of expansions, or the root is
+        # never expanded and there is no move to play
+        if max_nodes < 1 + batch_size * 140:
+            raise ValueError(f"max_nodes must be at least 1 + batch_size * 140 = {1 + batch_size * 140}, "
+                             f"got {max_nodes}")
+        super().__init__(name, environment)
+        self.evaluator = evaluator if evaluator is not None else DistanceEvaluator()
+        self.simulations = simulations
+        self.batch_size = batch_size
+        self.c_puct = c_puct
+        self.virtual_loss = virtual_loss
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+
+        for field, dtype in NODE_FIELDS:
+            setattr(self, field, np.zeros(max_nodes, dtype=dtype))
+
+        self._states = np.zeros([batch_size, N_PLANES, 9, 9], dtype=np.float32)
+        self._legal_masks = np.zeros([batch_size, 140], dtype=np.bool_)
+        self._encoders = [StateEncoder(out) for out in self._states]
+
+        self._board = None
+        self._history_length = 0
+        self.n_nodes = 0
+        self.root = 0
+        self.evaluator_calls = 0
+
+        # Simulations and most visited move so far in the current search
+        self.nodes = 0
+        self.best_action = None
+        self._stopped = False
+
+    def reset_tree(self):
+        """Forget the search tree, the next search starts from scratch."""
+        self._board = None
+
+    def choose_action(self):
+        self._find_root()
+        self.search()
+        # Once neither player has walls left the endgame table knows best
+        action = endgame.best_action(self._board)
+        if action is None:
+            action = self._most_visited()
+        self._advance(action)
+        return action
+
+    def policy(self):
+        """Visit counts at the root as a distribution over the 140 actions."""
+        policy = np.zeros(140, dtype=np.float32)
+        first = self.first_child[self.root]
+        if first >= 0:
+            children = slice(first, first + self.n_children[self.root])
+            policy[self.action[children]] = self.visits[children]
+            policy /= policy.sum()
+        return policy
+
+    def ponder(self):
+        """Grows the tree at the environment's position until stopped or out of node space."""
+        self._find_root()
+        self.search(math.inf, None)
+
+    def stop(self):
+        self._stopped = True
+
+    def search(self, simulations=None, time_limit=None):
+        """Runs simulations from the current root, by default the agent's own limits."""
+        if simulations is None:
+            simulations, time_limit = self.simulations, self.time_limit
+        deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self._stopped = False
+        self.nodes = 0
+        done = 0
+        while done < simulations and not self._stopped:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            selected = self._search_batch(min(self.batch_size, simulations - done))
+            if selected == 0:
+                # Out of node space, the tree can't grow any further
+                break
+            done += selected
+            self.nodes = done
+            self.best_action = self._most_visited()
+        return done
+
+    def _most_visited(self):
+        first = self.first_child[self.root]
+        if first < 0:
+            return None
+        visits = self.visits[first:first + self.n_children[self.root]]
+        return int(self.action[first + int(np.argmax(visits))])
+
+    def _find_root(self):
+        """Points the root at the environment's position, reusing the tree if possible."""
+        environment = self.environment
+        position = environment.to_bytes()
+        if self._board is not None and len(environment._history) >= self._history_length:
+            board = self._board.clone()
+            root = self.root
+            for move in environment._history[self._history_length:]:
+                action = move[0]
+                root = self._child(root, action)
+                if root < 0:
+                    break
+                board.push(action)
+            if root >= 0 and board.to_bytes() == position:
+                self._board = board
+                self._history_length = len(environment._history)
+                self._reroot(root)
+                return
+
+        self._board = BitboardQuoridor.from_bytes(position)
+        self._history_length = len(environment._history)
+        self.n_nodes = 1
+        self.root = 0
+        self._init_nodes(slice(0, 1), -1)
+
+    def _advance(self, action):
+        """Moves the root to the child for action once it's been played."""
+        child = self._child(self.root, action)
+        if child < 0:
+            self.reset_tree()
+            return
+        self._board.push(action)
+        self._history_length += 1
+        self._reroot(child)
+
+    def _child(self, node, action):
+        first = self.first_child[node]
+        if first < 0:
+            return -1
+        matches = np.flatnonzero(self.action[first:first + self.n_children[node]] == action)
+        return first + int(matches[0]) if matches.size else -1
+
+    def _reroot(self, root):
+        """Makes root the root and packs its subtree at the start of the arrays."""
+        # Breadth first renumbering keeps every node's children together
+        order = [np.array([root])]
+        level = order[0]
+        while level.size:
+            level = level[self.first_child[level] >= 0]
+            counts = self.n_children[level].astype(np.int64)
+            offsets = np.repeat(np.cumsum(counts) - counts, counts)
+            level = np.repeat(self.first_child[level], counts) + np.arange(counts.sum()) - offsets
+            order.append(level)
+        order = np.concatenate(order)
+
+        new_ids = np.full(self.max_nodes, -1, dtype=np.int32)
+        new_ids[order] = np.arange(order.size)
+        for field, _ in NODE_FIELDS:
+            array = getattr(self, field)
+            array[:order.size] = array[order]
+        expanded = self.first_child[:order.size] >= 0
+        self.first_child[:order.size][expanded] = new_ids[self.first_child[:order.size][expanded]]
+        self.parent[1:order.size] = new_ids[self.parent[1:order.size]]
+        self.parent[0] = -1
+        self.n_nodes = order.size
+        self.root = 0
+
+    def _init_nodes(self, nodes, parent, actions=-1, priors=0.0):
+        self.parent[nodes] = parent
+        self.action[nodes] = actions
+        self.first_child[nodes] = -1
+        self.n_children[nodes] = 0
+        self.visits[nodes] = 0
+        self.value_sum[nodes] = 0
+        self.prior[nodes] = priors
+
+    def _select_child(self, node):
+        first = self.first_child[node]
+        children = slice(first, first + self.n_children[node])
+        visits = self.visits[children]
+        q = self.value_sum[children] / np.maximum(visits, 1)
+        u = self.c_puct * self.prior[children] * math.sqrt(self.visits[node] + 1) / (1 + visits)
+        return first + int(np.argmax(q + u))
+
+    def _search_batch(self, size):
+        """Selects, evaluates and backs up up to size leaves. Returns how many."""
+        # Room for every leaf to be expanded with all 140 actions
+        if self.n_nodes + size * 140 > self.max_nodes:
+            return 0
+
+        leaves = []
+        selected = 0
+        for _ in range(size):
+            board = self._board.clone()
+            node = self.root
+            path = [node]
+            done = False
+            while self.first_child[node] >= 0:
+                node = self._select_child(node)
+                path.append(node)
+                _, done = board.push(int(self.action[node]))
+                if done:
+                    break
+
+            # The root is always expanded, so there's a policy to return
+            exact = endgame.probe(board) if not done and node != self.root else None
+            if done:
+                # The mover won, nothing to evaluate
+                self._backup(node, 1.0)
+            elif exact is not None:
+                # A pawn race with a known result, no need to grow the tree
+                # below it
+                self._backup(node, -float(exact[0]))
+            elif node in leaves:
+                # Already waiting for evaluation, the batch has run dry
+                break
+            else:
+                slot = len(leaves)
+                self._encoders[slot].encode(board)
+                board.legal_mask(out=self._legal_masks[slot])
+                leaves.append(node)
+                self._add_virtual_loss(path)
+            selected += 1
+
+        if not leaves:
+            return selected
+
+        priors, values = self.evaluator(self._states[:len(leaves)], self._legal_masks[:len(leaves)])
+        self.evaluator_calls += 1
+        for slot, node in enumerate(leaves):
+            self._remove_virtual_loss(node)
+            self._expand(node, slot, priors[slot])
+            # The evaluator scores the player to move at the leaf, the node
+            # holds values for the player who moved into it
+            self._backup(node, -float(values[slot]))
+        return selected
+
+    def _expand(self, node, slot, priors):
+        actions = np.flatnonzero(self._legal_masks[slot])
+        first = self.n_nodes
+        priors = priors[actions]
+        total = priors.sum()
+        self._init_nodes(slice(first, first + actions.size), node, actions,
+                         priors / total if total > 0 else 1 / actions.size)
+        self.first_child[node] = first
+        self.n_children[node] = actions.size
+        self.n_nodes += actions.size
+
+    def _add_virtual_loss(self, path):
+        loss = self.virtual_loss
+        for node in path:
+            self.visits[node] += loss
+            self.value_sum[node] -= loss
+
+    def _remove_virtual_loss(self, leaf):
+        loss = self.virtual_loss
+        node = leaf
+        while node >= 0:
+            self.visits[node] -= loss
+            self.value_sum[node] += loss
+            node = self.parent[node]
+
+    def _backup(self, leaf, value):
+        node = leaf
+        while node >= 0:
+            self.visits[node] += 1
+            self.value_sum[node] += value
+            value = -value
+            node = self.parent[node]
@@ -0,0 +1,117 @@
+import threading
+import time
+
+
+class AgentRunner:
+    """Runs an agent's search on a background thread.
+
+    think starts choosing a move for a game's position and poll returns it
+    once it's ready, so a render loop can keep drawing meanwhile. While the
+    opponent is to move, ponder lets the agent search anyway, for agents
+    that keep something between moves (a transposition table, a tree).
+
+    The agent gets its own copy of the game, kept in step with the real
+    one move by move so its move history (which MCTSAgent follows to reuse
+    its tree) carries on. Searches are stopped with the agent's stop method,
+    after time_budget seconds of thinking or when cancelled.
+    """
+
+    def __init__(self, agent, time_budget=1.0):
+        self.agent = agent
+        self.time_budget = time_budget
+        if hasattr(agent, 'time_limit'):
+            agent.time_limit = time_budget
+
+        self._game = None
+        self._seen = 0
+        self._thread = None
+        self._thinking = False
+        self._result = None
+        self._started = None
+        # Zobrist hash of the position last pondered, so it isn't pondered
+        # again once the search has finished
+        self._pondered = None
+
+    @property
+    def busy(self):
+        """Whether a search (thinking or pondering) is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def thinking(self):
+        return self._thinking
+
+    def think(self, game):
+        """Starts choosing a move for the game's position."""
+        self._start(game, self._think)
+        self._thinking = True
+        self._pondered = None
+
+    def ponder(self, game):
+        """Starts searching the game's position until the next think or cancel.
+
+        Does nothing while a search is running or once the position has been
+        pondered, for agents whose ponder ends by itself (a full tree, or no
+        pondering at all).
+        """
+        if self.busy or game.zobrist_hash == self._pondered:
+            return
+        self._start(game, self.agent.ponder)
+        self._pondered = game.zobrist_hash
+
+    def poll(self):
+        """The chosen move once thinking has finished, otherwise None.
+
+        Stops the search if it has run over its time budget.
+        """
+        if not self._thinking:
+            return None
+        if self.busy:
+            if time.perf_counter() - self._started > self.time_budget:
+                self.agent.stop()
+            return None
+        self._thread = None
+        self._thinking = False
+        return self._result
+
+    def cancel(self):
+        """Stops any search and waits for its thread to finish."""
+        while self.busy:
+            self.agent.stop()
+            self._thread.join(0.01)
+        self._thread = None
+        self._thinking = False
+
+    def progress(self):
+        """The running search's best move so far, node count and depth, where the agent has them."""
+        return {
+            'best_action': getattr(self.agent, 'best_action', None),
+            'nodes': getattr(self.agent, 'nodes', None),
+            'depth': getattr(self.agent, 'depth', None),
+            'seconds': time.perf_counter() - self._started if self.busy else 0.0,
+        }
+
+    def _start(self, game, target):
+        self.cancel()
+        self._sync(game)
+        self._result = None
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+
+    def _think(self):
+        self._result = self.agent.choose_action()
+
+    def _sync(self, game):
+        """Brings the agent's copy of the game up to the real game's position."""
+        history = game._history
+        if self._game is not None and len(history) >= self._seen:
+            for move in history[self._seen:]:
+                self._game.push(move[0])
+            if self._game.zobrist_hash == game.zobrist_hash:
+                self._seen = len(history)
+                return
+
+        self._game = game.clone()
+        self._seen = len(history)
+        self.agent.environment = self._game
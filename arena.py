@@ -0,0 +1,216 @@
+"""Headless agent-vs-agent tournaments.
+
+Plays every pairing of the given agents across a process pool, both ways
+round, and reports win rates, Elo ratings and games per second for each
+worker count. Finished games go into a shared-memory ReplayBuffer, and
+optionally to game records. Run as
+
+    python arena.py --agents alphabeta:time_limit=0.05 mcts:simulations=200 random --games 4 --workers 1 2 4
+
+Agents are given as name[:key=value,...] with keyword arguments passed to
+the agent's constructor.
+"""
+import argparse
+import ast
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from multiprocessing import Lock, Pool
+
+import numpy as np
+
+from agents.alphabeta import AlphaBetaAgent
+from agents.base import BaseAgent
+from agents.mcts import MCTSAgent
+from environment.quoridor import Quoridor
+from environment.records import GameWriter
+from environment.replay import ReplayBuffer
+
+AGENTS = {
+    'random': BaseAgent,
+    'alphabeta': AlphaBetaAgent,
+    'mcts': MCTSAgent,
+}
+
+# The replay buffer as seen by each worker process
+_buffer = None
+
+
+def parse_agent(spec):
+    """(class, keyword arguments) for an agent spec like 'mcts:simulations=200,batch_size=16'."""
+    name, _, arguments = spec.partition(':')
+    if name not in AGENTS:
+        raise ValueError(f"Unknown agent: {name}")
+    kwargs = {}
+    for argument in filter(None, arguments.split(',')):
+        key, _, value = argument.partition('=')
+        try:
+            kwargs[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            kwargs[key] = value
+    return AGENTS[name], kwargs
+
+
+def _init_worker(buffer_name, capacity, lock):
+    global _buffer
+    _buffer = ReplayBuffer(capacity, buffer_name, create=False, lock=lock)
+
+
+def play_game(job):
+    """Plays one game between two agent specs. Returns (moves, winner).
+
+    Only moves travel back to the driver. The game's positions are written
+    straight into the worker's replay buffer, if it has one.
+    """
+    specs, seed, max_plies = job
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+
+    game = Quoridor()
+    agents = {}
+    for player, spec in zip((1, 2), specs):
+        cls, kwargs = parse_agent(spec)
+        agents[player] = cls(spec, game, **kwargs)
+
+    moves = []
+    done = False
+    while not done and len(moves) < max_plies:
+        action = int(agents[game.current_player].choose_action())
+        _, done = game.push(action)
+        moves.append(action)
+
+    winner = game.winner
+    if _buffer is not None:
+        _buffer.add_game(moves, winner)
+    return moves, winner
+
+
+def schedule(specs, games, max_plies=400, seed=0):
+    """play_game jobs, games per ordered pairing of specs so each plays both sides.
+
+    A single spec plays itself.
+    """
+    rng = random.Random(seed)
+    pairs = list(itertools.permutations(specs, 2)) if len(specs) > 1 else [(specs[0], specs[0])]
+    return [(pair, rng.getrandbits(64), max_plies) for pair in pairs for _ in range(games)]
+
+
+def elo_ratings(results, iterations=200):
+    """Elo ratings fitted to (first, second, score of first) results, averaging 1500.
+
+    Every player also gets one virtual draw against a 1500 player, so a
+    player who won (or lost) every game still has a finite rating.
+    """
+    players = sorted({player for first, second, _ in results for player in (first, second)})
+    ratings = dict.fromkeys(players, 1500.0)
+    for _ in range(iterations):
+        for player in players:
+            score = 0.5
+            expected = 1 / (1 + 10 ** ((ratings[player] - 1500) / -400))
+            games = 1
+            for first, second, result in results:
+                if player == first:
+                    opponent, result_for_player = second, result
+                elif player == second:
+                    opponent, result_for_player = first, 1 - result
+                else:
+                    continue
+                score += result_for_player
+                expected += 1 / (1 + 10 ** ((ratings[opponent] - ratings[player]) / 400))
+                games += 1
+            # A Newton step taking every p (1 - p) at its largest, 1/4, so it
+            # never overshoots
+            ratings[player] += 4 * 400 / math.log(10) * (score - expected) / games
+    mean = sum(ratings.values()) / len(ratings)
+    return {player: rating - mean + 1500 for player, rating in ratings.items()}
+
+
+def summarise(specs, jobs, games):
+    """Wins, losses, draws, win rate and Elo per spec."""
+    table = {spec: {'wins': 0, 'losses': 0, 'draws': 0} for spec in specs}
+    results = []
+    for (pair, _, _), (_, winner) in zip(jobs, games):
+        if winner is None:
+            for spec in pair:
+                table[spec]['draws'] += 1
+            results.append((pair[0], pair[1], 0.5))
+            continue
+        table[pair[winner - 1]]['wins'] += 1
+        table[pair[2 - winner]]['losses'] += 1
+        results.append((pair[0], pair[1], 1.0 if winner == 1 else 0.0))
+
+    ratings = elo_ratings(results)
+    for spec, row in table.items():
+        played = row['wins'] + row['losses'] + row['draws']
+        row['win_rate'] = (row['wins'] + row['draws'] / 2) / played if played else None
+        row['elo'] = ratings.get(spec)
+    return table
+
+
+def run(specs, games=2, workers=(1,), max_plies=400, buffer_size=2 ** 16, records=None, seed=0):
+    """Plays the tournament once per worker count.
+
+    Returns a dict with the standings over every game played, games per
+    second at each worker count and the number of positions in the replay
+    buffer.
+    """
+    jobs = schedule(specs, games, max_plies, seed)
+    all_jobs = []
+    all_games = []
+    speed = {}
+    with ReplayBuffer(buffer_size, lock=Lock()) as buffer:
+        for n_workers in workers:
+            start = time.perf_counter()
+            with Pool(n_workers, _init_worker, (buffer.name, buffer_size, buffer.lock)) as pool:
+                finished = pool.map(play_game, jobs, chunksize=1)
+            elapsed = time.perf_counter() - start
+            speed[n_workers] = {'games_per_second': len(jobs) / elapsed, 'seconds': elapsed}
+            all_jobs.extend(jobs)
+            all_games.extend(finished)
+        positions = len(buffer)
+
+    if records is not None:
+        with GameWriter(records) as writer:
+            for moves, winner in all_games:
+                writer.write(moves, winner)
+
+    return {
+        'standings': summarise(specs, all_jobs, all_games),
+        'speed': speed,
+        'games': len(all_games),
+        'buffer_positions': positions,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', nargs='+', default=['alphabeta:time_limit=0.05', 'random'])
+    parser.add_argument('--games', type=int, default=2, help="games per ordered pairing")
+    parser.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count()],
+                        help="worker counts to play the tournament with")
+    parser.add_argument('--max-plies', type=int, default=400, help="plies before a game counts as a draw")
+    parser.add_argument('--buffer-size', type=int, default=2 ** 16, help="positions held in the replay buffer")
+    parser.add_argument('--records', help="directory to write game records to")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON results file (default stdout)")
+    args = parser.parse_args(argv)
+
+    for spec in args.agents:
+        parse_agent(spec)
+    results = run(args.agents, args.games, args.workers, args.max_plies, args.buffer_size, args.records, args.seed)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+import numpy as np
+
+from .quoridor import (DIAGONAL_JUMPS, EAST, EAST_EDGES, HORIZONTAL_CUTS, NORTH, NORTH_EDGES, PAWN_DELTAS,
+                       PERPENDICULAR, SOUTH, STRAIGHT_JUMPS, VERTICAL_CUTS, WEST, Quoridor, _expand, _reaches)
+
+# Tiles are bits 0-80 of a Python int (bit = row * 9 + column, row 0 is the
+# south edge). Intersections are bits 0-63 (bit = row * 8 + column), the same
+# indexing Quoridor uses for its _intersections array.
+#
+# Instead of storing walls per intersection, the engine keeps two masks of
+# open edges: NORTH (tile t can step to t + 9) and EAST (tile t can step to
+# t + 1). South and west edges are the same edges seen from the other side.
+# The masks, the edges each wall closes, _expand and _reaches are shared with
+# Quoridor.
+
+ALL_INTERSECTIONS = (1 << 64) - 1
+
+ROW_MASKS = [0x1FF << (9 * row) for row in range(9)]
+
+GOALS = {1: ROW_MASKS[8], 2: ROW_MASKS[0]}
+
+# Intersections that are not in the first/last column of the 8x8 grid
+NOT_FIRST_COLUMN = sum(1 << ix for ix in range(64) if ix % 8 != 0)
+NOT_LAST_COLUMN = sum(1 << ix for ix in range(64) if ix % 8 != 7)
+
+
+def _distances(goal, north, east):
+    """Steps from every tile to the goal tiles, None where it can't be reached."""
+    distances = [None] * 81
+    frontier = visited = goal
+    distance = 0
+    while frontier:
+        tiles = frontier
+        while tiles:
+            low = tiles & -tiles
+            distances[low.bit_length() - 1] = distance
+            tiles ^= low
+        frontier = _expand(frontier, north, east) & ~visited
+        visited |= frontier
+        distance += 1
+    return distances
+
+
+class BitboardQuoridor:
+    """Quoridor engine backed by integer bitmasks.
+
+    Exposes the same actions / step / push / pop / reset API as Quoridor, so it
+    can be used as a drop-in replacement wherever move generation is the
+    bottleneck.
+    Wall legality follows the standard rule: a wall may not cut either pawn
+    off from its goal row, where only walls (not pawns) block the path.
+    """
+
+    HORIZONTAL = 1
+    VERTICAL = -1
+
+    _DIRECTIONS = {
+        'N' : 0, 'S' : 1, 'E' : 2, 'W' : 3,
+        'NN' : 4, 'SS' : 5, 'EE' : 6, 'WW' : 7,
+        'NE' : 8, 'NW' : 9, 'SE' : 10, 'SW' : 11
+    }
+
+    def __init__(self, safe=False):
+        self.safe = safe
+
+        self.action_space = 140 # 140 possible actions in total
+        self.n_players = 2
+        self.reset()
+
+    def reset(self):
+        self.current_player = 1
+        self.last_player = -1
+
+        # Indexed by player, slot 0 is unused
+        self._positions = [-1, 4, 76]
+
+        self._horizontal = 0
+        self._vertical = 0
+        self._north = NORTH_EDGES
+        self._east = EAST_EDGES
+
+        self._player1_walls_remaining = 10
+        self._player2_walls_remaining = 10
+
+        # Shortest paths for each player as (north-south edges, east-west edges)
+        self._paths = {1: None, 2: None}
+
+        # Steps to the goal from every tile for each player, see _distance_map
+        self._distance_maps = OPEN_BOARD_DISTANCES.copy()
+
+        # Moves made with push / step, as the information pop needs to undo them
+        self._history = []
+
+    # Rendering, observation encoding and serialization are shared with the
+    # reference engine. They only read _positions, _intersections and the
+    # wall counts.
+    state = Quoridor.state
+    print_board = Quoridor.print_board
+    to_bytes = Quoridor.to_bytes
+    from_bytes = classmethod(Quoridor.from_bytes.__func__)
+    load_bytes = Quoridor.load_bytes
+
+    def _set_position(self, positions, intersections, walls_remaining, current_player):
+        self.reset()
+        for ix in np.flatnonzero(intersections):
+            self._handle_wall_action(int(ix) if intersections[ix] == self.HORIZONTAL else int(ix) + 64)
+        self._positions = [-1, positions[1], positions[2]]
+        self._player1_walls_remaining = walls_remaining[1]
+        self._player2_walls_remaining = walls_remaining[2]
+        self.current_player = current_player
+        self.last_player = 1 if current_player == 2 else 2
+
+    @property
+    def _intersections(self):
+        intersections = np.zeros(64)
+        for ix in range(64):
+            if self._horizontal >> ix & 1:
+                intersections[ix] = self.HORIZONTAL
+            elif self._vertical >> ix & 1:
+                intersections[ix] = self.VERTICAL
+        return intersections
+
+    @property
+    def actions(self):
+        """The valid actions for the current gamestate"""
+        player = self.current_player
+        opponent = 1 if player == 2 else 2
+        actions = self._valid_pawn_actions(self._positions[player], self._positions[opponent], player)
+
+        if ((player == 1 and self._player1_walls_remaining > 0)
+            or (player == 2 and self._player2_walls_remaining > 0)):
+            actions.extend(self._valid_wall_actions())
+        return actions
+
+    def legal_mask(self, out=None):
+        """Boolean mask of which of the 140 actions are valid."""
+        if out is None:
+            out = np.zeros(self.action_space, dtype=np.bool_)
+        out[:] = False
+        out[self.actions] = True
+        return out
+
+    def is_legal(self, action):
+        """Whether a single action is valid, without generating the others."""
+        if not 0 <= action < self.action_space:
+            return False
+        player = self.current_player
+        if action < 12:
+            opponent = 1 if player == 2 else 2
+            return action in self._valid_pawn_actions(self._positions[player], self._positions[opponent], player)
+
+        if ((player == 1 and self._player1_walls_remaining == 0)
+            or (player == 2 and self._player2_walls_remaining == 0)):
+            return False
+
+        wall = action - 12
+        north = self._north
+        east = self._east
+        if wall < 64:
+            horizontal = self._horizontal
+            if ((horizontal | self._vertical) >> wall & 1
+                or (wall % 8 != 0 and horizontal >> (wall - 1) & 1)
+                or (wall % 8 != 7 and horizontal >> (wall + 1) & 1)):
+                return False
+            north &= ~HORIZONTAL_CUTS[wall]
+        else:
+            wall -= 64
+            vertical = self._vertical
+            if ((self._horizontal | vertical) >> wall & 1
+                or (wall >= 8 and vertical >> (wall - 8) & 1)
+                or (wall < 56 and vertical >> (wall + 8) & 1)):
+                return False
+            east &= ~VERTICAL_CUTS[wall]
+
+        return (_reaches(1 << self._positions[1], GOALS[1], north, east)
+                and _reaches(1 << self._positions[2], GOALS[2], north, east))
+
+    def step(self, action):
+        """Take a step in the environment given the current action"""
+        if self.safe:
+            if not action in self.actions:
+                raise ValueError(f"Invalid Action: {action}")
+
+        rewards, done = self.push(action)
+        if done:
+            observation = None
+        else:
+            observation = self.state
+
+        return observation, rewards, done
+
+    def push(self, action):
+        """Make a move without building an observation. Undo it with pop.
+
+        Returns the rewards and whether the game is over. The turn only
+        passes to the other player if the game continues, as in step.
+        """
+        player = self.current_player
+        self._history.append((action, player, self._positions[player], self._paths.copy(),
+                              self._distance_maps.copy(), self.last_player))
+
+        if action < 12:
+            self._handle_pawn_action(action, player)
+        else:
+            self._handle_wall_action(action - 12)
+
+        rewards, done = self._get_rewards()
+        if not done:
+            self.rotate_players()
+        return rewards, done
+
+    def pop(self):
+        """Undo the last move made with push or step."""
+        action, player, position, paths, distance_maps, last_player = self._history.pop()
+
+        if action < 12:
+            self._positions[player] = position
+        else:
+            ix = (action - 12) % 64
+            # Every edge is closed by at most one wall, so it's open again
+            if action < 76:
+                self._horizontal &= ~(1 << ix)
+                self._north |= HORIZONTAL_CUTS[ix]
+            else:
+                self._vertical &= ~(1 << ix)
+                self._east |= VERTICAL_CUTS[ix]
+            if player == 1:
+                self._player1_walls_remaining += 1
+            else:
+                self._player2_walls_remaining += 1
+
+        self._paths = paths
+        self._distance_maps = distance_maps
+        self.current_player = player
+        self.last_player = last_player
+        return action
+
+    _get_rewards = Quoridor._get_rewards
+    winner = Quoridor.winner
+
+    def _handle_pawn_action(self, action, player):
+        if not 0 <= action < 12:
+            raise ValueError(f"Invalid Pawn Action: {action}")
+        self._positions[player] += PAWN_DELTAS[action]
+        self._paths[player] = None
+
+    def _handle_wall_action(self, action):
+        # Action values less than 64 are horizontal walls
+        if action < 64:
+            self._horizontal |= 1 << action
+            cut = HORIZONTAL_CUTS[action]
+            self._north &= ~cut
+            for player, path in self._paths.items():
+                if path is not None and path[0] & cut:
+                    self._paths[player] = None
+        # Action values above 64 are vertical walls
+        else:
+            action -= 64
+            self._vertical |= 1 << action
+            cut = VERTICAL_CUTS[action]
+            self._east &= ~cut
+            for player, path in self._paths.items():
+                if path is not None and path[1] & cut:
+                    self._paths[player] = None
+        self._distance_maps = {1: None, 2: None}
+
+        if self.current_player == 1:
+            self._player1_walls_remaining -= 1
+        else:
+            self._player2_walls_remaining -= 1
+
+    def rotate_players(self):
+        """Switch the player turn"""
+        if self.current_player == 1:
+            self.current_player = 2
+            self.last_player = 1
+        else:
+            self.current_player = 1
+            self.last_player = 2
+
+    def _edge_open(self, tile, direction):
+        if direction == NORTH:
+            return self._north >> tile & 1
+        if direction == SOUTH:
+            return tile >= 9 and self._north >> (tile - 9) & 1
+        if direction == EAST:
+            return self._east >> tile & 1
+        return tile % 9 != 0 and self._east >> (tile - 1) & 1
+
+    def _valid_pawn_actions(self, location, opponent_loc, player=1):
+        valid = []
+        for direction in (NORTH, SOUTH, EAST, WEST):
+            if not self._edge_open(location, direction):
+                continue
+
+            target = location + PAWN_DELTAS[direction]
+            if target != opponent_loc:
+                valid.append(direction)
+                continue
+
+            # Jumping over the opponent's pawn off the board reaches the goal
+            goal_jump = ((player == 1 and direction == NORTH and opponent_loc > 71)
+                         or (player == 2 and direction == SOUTH and opponent_loc < 9))
+            if goal_jump or self._edge_open(opponent_loc, direction):
+                valid.append(STRAIGHT_JUMPS[direction])
+
+            for side in PERPENDICULAR[direction]:
+                if self._edge_open(opponent_loc, side):
+                    valid.append(DIAGONAL_JUMPS[direction, side])
+        return valid
+
+    def _valid_wall_actions(self):
+        horizontal = self._horizontal
+        vertical = self._vertical
+        occupied = horizontal | vertical
+
+        horizontal_free = ALL_INTERSECTIONS & ~(occupied
+            | ((horizontal << 1) & NOT_FIRST_COLUMN)
+            | ((horizontal >> 1) & NOT_LAST_COLUMN))
+        vertical_free = ALL_INTERSECTIONS & ~(occupied
+            | (vertical << 8) | (vertical >> 8))
+
+        north_path1, east_path1 = self._shortest_path(1)
+        north_path2, east_path2 = self._shortest_path(2)
+        north_paths = north_path1 | north_path2
+        east_paths = east_path1 | east_path2
+
+        north = self._north
+        east = self._east
+        start1 = 1 << self._positions[1]
+        start2 = 1 << self._positions[2]
+
+        valid = []
+        while horizontal_free:
+            low = horizontal_free & -horizontal_free
+            ix = low.bit_length() - 1
+            horizontal_free ^= low
+
+            cut = HORIZONTAL_CUTS[ix]
+            # Walls that leave both shortest paths intact never need a search
+            if not north_paths & cut:
+                valid.append(ix + 12)
+                continue
+            blocked = north & ~cut
+            if ((not north_path1 & cut or _reaches(start1, GOALS[1], blocked, east))
+                and (not north_path2 & cut or _reaches(start2, GOALS[2], blocked, east))):
+                valid.append(ix + 12)
+
+        while vertical_free:
+            low = vertical_free & -vertical_free
+            ix = low.bit_length() - 1
+            vertical_free ^= low
+
+            cut = VERTICAL_CUTS[ix]
+            if not east_paths & cut:
+                valid.append(ix + 64 + 12)
+                continue
+            blocked = east & ~cut
+            if ((not east_path1 & cut or _reaches(start1, GOALS[1], north, blocked))
+                and (not east_path2 & cut or _reaches(start2, GOALS[2], north, blocked))):
+                valid.append(ix + 64 + 12)
+
+        return valid
+
+    def _shortest_path(self, player):
+        """The edges on one shortest path from the player's pawn to its goal.
+
+        Returned as (north-south edges, east-west edges), each a tile mask
+        holding the southern / western tile of every edge on the path.
+        """
+        path = self._paths[player]
+        if path is not None:
+            return path
+
+        north = self._north
+        east = self._east
+        goal = GOALS[player]
+
+        frontier = visited = 1 << self._positions[player]
+        layers = [frontier]
+        while not frontier & goal:
+            frontier = _expand(frontier, north, east) & ~visited
+            if not frontier:
+                # Unreachable goals can't happen in a legal position
+                self._paths[player] = (0, 0)
+                return self._paths[player]
+            visited |= frontier
+            layers.append(frontier)
+
+        # Walk back from a goal tile through the BFS layers
+        frontier = layers.pop() & goal
+        tile = (frontier & -frontier).bit_length() - 1
+        north_path = 0
+        east_path = 0
+        for layer in reversed(layers):
+            if tile >= 9 and layer >> (tile - 9) & 1 and north >> (tile - 9) & 1:
+                tile -= 9
+                north_path |= 1 << tile
+            elif layer >> (tile + 9) & 1 and north >> tile & 1:
+                north_path |= 1 << tile
+                tile += 9
+            elif tile % 9 != 0 and layer >> (tile - 1) & 1 and east >> (tile - 1) & 1:
+                tile -= 1
+                east_path |= 1 << tile
+            else:
+                east_path |= 1 << tile
+                tile += 1
+
+        self._paths[player] = (north_path, east_path)
+        return self._paths[player]
+
+    def _distance_map(self, player):
+        """Steps from every tile to the player's goal row, None where it's cut off.
+
+        Only walls block, pawns are ignored. Cached until the next wall.
+        """
+        distances = self._distance_maps[player]
+        if distances is None:
+            distances = _distances(GOALS[player], self._north, self._east)
+            self._distance_maps[player] = distances
+        return distances
+
+    def clone(self):
+        game = BitboardQuoridor.__new__(BitboardQuoridor)
+        game.__dict__.update(self.__dict__)
+        game._positions = self._positions[:]
+        game._paths = self._paths.copy()
+        game._distance_maps = self._distance_maps.copy()
+        # Like Quoridor.clone, the copy starts with nothing to pop
+        game._history = []
+        return game
+
+
+# Distance maps before any wall is placed, shared by every game
+OPEN_BOARD_DISTANCES = {player: _distances(GOALS[player], NORTH_EDGES, EAST_EDGES) for player in (1, 2)}
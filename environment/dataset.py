@@ -0,0 +1,129 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .encoder import N_PLANES, StateEncoder
+from .quoridor import Quoridor
+from .records import SHARD_SUFFIX, GameReader, shard_paths
+
+# Training shards.
+#
+# A shard is four .npy files named <shard>-<field>.npy, with one row per ply:
+# states (n, 25, 9, 9) in the Quoridor.state layout, legal masks (n, 140),
+# actions (n,) and outcomes (n,). The outcome is from the point of view of
+# the player to move: 1 if they went on to win, -1 if they lost and 0 if the
+# game was unfinished.
+
+FIELDS = ('states', 'legal_masks', 'actions', 'outcomes')
+
+
+def load_shard(shard, mmap_mode='r'):
+    """The (states, legal_masks, actions, outcomes) arrays of a shard."""
+    return tuple(np.load(f'{shard}-{field}.npy', mmap_mode=mmap_mode) for field in FIELDS)
+
+
+class ShardWriter:
+    """Writes plies into fixed-size memory-mapped shards.
+
+    Rows go straight to disk, so memory use doesn't grow with the shard
+    size. The last shard is trimmed to the rows written when closed.
+    """
+
+    def __init__(self, directory, name, shard_size=2 ** 14, dtype=np.float32):
+        self.directory = directory
+        self.name = name
+        self.shard_size = shard_size
+        self.dtype = dtype
+
+        self.shards = []
+        self._arrays = None
+        self._row = 0
+
+    def write(self, state, legal_mask, action, outcome):
+        if self._arrays is None or self._row == self.shard_size:
+            self._open_shard()
+
+        states, legal_masks, actions, outcomes = self._arrays
+        row = self._row
+        states[row] = state
+        legal_masks[row] = legal_mask
+        actions[row] = action
+        outcomes[row] = outcome
+        self._row += 1
+
+    def _open_shard(self):
+        self._close_shard()
+        shard = os.path.join(self.directory, f'{self.name}-{len(self.shards):04d}')
+        self.shards.append(shard)
+
+        shapes = ((N_PLANES, 9, 9), (140,), (), ())
+        dtypes = (self.dtype, np.bool_, np.uint8, np.int8)
+        self._arrays = [open_memmap(f'{shard}-{field}.npy', mode='w+', dtype=dtype, shape=(self.shard_size,) + shape)
+                        for field, dtype, shape in zip(FIELDS, dtypes, shapes)]
+        self._row = 0
+
+    def _close_shard(self):
+        if self._arrays is None:
+            return
+
+        shard = self.shards[-1]
+        for field, array in zip(FIELDS, self._arrays):
+            array.flush()
+            if self._row < self.shard_size:
+                path = f'{shard}-{field}.npy'
+                trimmed = open_memmap(path + '.tmp', mode='w+', dtype=array.dtype,
+                                      shape=(self._row,) + array.shape[1:])
+                trimmed[:] = array[:self._row]
+                trimmed.flush()
+                del trimmed
+                os.replace(path + '.tmp', path)
+        self._arrays = None
+
+    def close(self):
+        self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def convert_records(path, directory, shard_size=2 ** 14, dtype=np.float32):
+    """Replays every game of a record shard into training shards.
+
+    Returns the training shards written, named after the record shard.
+    """
+    name = os.path.basename(path)[:-len(SHARD_SUFFIX)]
+    encoder = StateEncoder(dtype=dtype)
+    legal_mask = np.zeros(140, dtype=np.bool_)
+
+    with GameReader(path) as reader, ShardWriter(directory, name, shard_size, dtype) as writer:
+        for record in reader:
+            game = Quoridor()
+            for action in record.moves:
+                if record.winner is None:
+                    outcome = 0
+                else:
+                    outcome = 1 if game.current_player == record.winner else -1
+                writer.write(encoder.encode(game), game.legal_mask(out=legal_mask), action, outcome)
+                game.push(action)
+    return writer.shards
+
+
+def build_dataset(records_directory, directory, prefix='games', shard_size=2 ** 14, workers=None,
+                  dtype=np.float32):
+    """Converts every record shard in a directory, one shard per worker at a time.
+
+    Returns the paths of the training shards written, to be read with load_shard.
+    """
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(path, directory, shard_size, dtype) for path in shard_paths(records_directory, prefix)]
+    if workers == 1:
+        results = [convert_records(*job) for job in jobs]
+    else:
+        with Pool(workers) as pool:
+            results = pool.starmap(convert_records, jobs)
+    return [shard for shards in results for shard in shards]
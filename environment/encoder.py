@@ -0,0 +1,124 @@
+import numpy as np
+
+# Observation planes, each 9x9 (see Quoridor.state)
+N_PLANES = 25
+VERTICAL_PLANE = 0
+HORIZONTAL_PLANE = 1
+PLAYER_PLANE = 2
+OPPONENT_PLANE = 3
+PLAYER_WALLS_PLANES = 4 # 10 planes, one per wall count from 1 to 10
+OPPONENT_WALLS_PLANES = 14
+TURN_PLANE = 24
+
+
+def encode_arrays(walls, positions, walls_remaining, current_player, out=None, dtype=np.float32):
+    """Encodes a batch of positions held as arrays.
+
+    walls is (n, 64) in the Quoridor._intersections convention, positions
+    and walls_remaining are (n, 2) with player 1 first and current_player is
+    (n,). Writes the (n, 25, 9, 9) planes into out, allocating it if needed.
+    """
+    n_games = len(current_player)
+    if out is None:
+        out = np.zeros([n_games, N_PLANES, 9, 9], dtype=dtype)
+    else:
+        out[:] = 0
+
+    games = np.arange(n_games)
+    player = np.asarray(current_player) - 1
+    opponent = 1 - player
+
+    walls = np.asarray(walls).reshape(-1, 8, 8)
+    out[:, VERTICAL_PLANE, :8, :8] = walls == -1
+    out[:, HORIZONTAL_PLANE, :8, :8] = walls == 1
+
+    # A pawn that has jumped off the board to win has no tile to mark
+    for plane, owner in ((PLAYER_PLANE, player), (OPPONENT_PLANE, opponent)):
+        tiles = positions[games, owner]
+        on_board = (tiles >= 0) & (tiles < 81)
+        out[games[on_board], plane, tiles[on_board] // 9, tiles[on_board] % 9] = 1
+
+    # No plane is set for a player without walls
+    for first, owner in ((PLAYER_WALLS_PLANES, player), (OPPONENT_WALLS_PLANES, opponent)):
+        counts = walls_remaining[games, owner]
+        has_walls = counts > 0
+        out[games[has_walls], first + counts[has_walls] - 1] = 1
+
+    out[:, TURN_PLANE] = player[:, None, None]
+    return out
+
+
+def encode_state(game, out):
+    """Writes every plane of a game's state into a (25, 9, 9) buffer."""
+    return StateEncoder(out).encode(game)
+
+
+def encode_many(games, out=None, dtype=np.float32):
+    """Encodes a list of games into a (n, 25, 9, 9) buffer."""
+    walls = np.array([game._intersections for game in games])
+    positions = np.array([(game._positions[1], game._positions[2]) for game in games])
+    walls_remaining = np.array([(game._player1_walls_remaining, game._player2_walls_remaining)
+                                for game in games])
+    current_player = np.array([game.current_player for game in games])
+    return encode_arrays(walls, positions, walls_remaining, current_player, out=out, dtype=dtype)
+
+
+class StateEncoder:
+    """Encodes a game's state into one reusable buffer.
+
+    Remembers what it last wrote, so each call only rewrites the planes (and
+    wall cells) that changed since then. The buffer must not be modified
+    between calls.
+    """
+
+    def __init__(self, out=None, dtype=np.float32):
+        if out is None:
+            out = np.zeros([N_PLANES, 9, 9], dtype=dtype)
+        self.out = out
+        self.reset()
+
+    def reset(self):
+        """Forget the buffer's contents, so the next encode writes every plane."""
+        self.out[:] = 0
+        self._walls = np.zeros(64)
+        self._pawns = (None, None)
+        self._walls_remaining = (0, 0)
+        self._player = 1
+
+    def encode(self, game):
+        out = self.out
+        player = game.current_player
+        opponent = 1 if player == 2 else 2
+
+        walls = game._intersections
+        changed = np.flatnonzero(walls != self._walls)
+        if changed.size:
+            rows, columns = np.divmod(changed, 8)
+            out[VERTICAL_PLANE, rows, columns] = walls[changed] == -1
+            out[HORIZONTAL_PLANE, rows, columns] = walls[changed] == 1
+            self._walls = walls.copy()
+
+        pawns = (game._positions[player], game._positions[opponent])
+        for plane, previous, tile in zip((PLAYER_PLANE, OPPONENT_PLANE), self._pawns, pawns):
+            if tile != previous:
+                if previous is not None and 0 <= previous < 81:
+                    out[plane, previous // 9, previous % 9] = 0
+                if 0 <= tile < 81:
+                    out[plane, tile // 9, tile % 9] = 1
+        self._pawns = pawns
+
+        remaining = (game._player1_walls_remaining, game._player2_walls_remaining)
+        walls_remaining = (remaining[player - 1], remaining[opponent - 1])
+        for first, previous, count in zip((PLAYER_WALLS_PLANES, OPPONENT_WALLS_PLANES),
+                                          self._walls_remaining, walls_remaining):
+            if count != previous:
+                if previous > 0:
+                    out[first + previous - 1] = 0
+                if count > 0:
+                    out[first + count - 1] = 1
+        self._walls_remaining = walls_remaining
+
+        if player != self._player:
+            out[TURN_PLANE] = player - 1
+            self._player = player
+        return out
@@ -0,0 +1,232 @@
+"""Exact endgames once both players are out of walls.
+
+With no walls left to place the game is a pawn race on a fixed wall layout,
+with at most 2 x 81 x 81 positions. solve labels every one of them by
+retrograde analysis, a ply at a time back from the positions where the
+player to move can step onto its goal, with all the pawn moves (jumps
+included) of every position generated at once. Tables are cached by a
+Zobrist hash of the wall layout, so searches and playouts can probe any
+position with no walls left and stop there.
+"""
+import numpy as np
+
+from .quoridor import (DIAGONAL_JUMPS, EAST, NEIGHBOURS, NORTH, PAWN_DELTAS, PERPENDICULAR, SOUTH, STRAIGHT_JUMPS,
+                       WEST, ZOBRIST_PAWNS, ZOBRIST_PLAYER2, ZOBRIST_WALLS, ZOBRIST_WALLS_REMAINING, Quoridor)
+from .transposition import TranspositionCache
+
+# Results, from the point of view of the player to move. A position nobody
+# can force a win from (both pawns shuffling forever) is a draw.
+WIN, DRAW, LOSS = 1, 0, -1
+
+# Solved tables by wall layout hash
+_tables = TranspositionCache(maxsize=256)
+
+
+def _index(player, player1, player2):
+    return (player - 1) * 6561 + player1 * 81 + player2
+
+
+# Geometry of every (player 1 tile, player 2 tile), as flat arrays in table
+# order, computed once. By player to move:
+#   LOCATIONS, OPPONENTS - the mover's and the opponent's tile
+#   ADJACENT - whether the opponent is next to the mover, by direction
+#   GOAL_JUMPS - whether a straight jump north (player 1) or south (player 2)
+#       would leave the board onto the goal
+#   GOAL_MOVES - which pawn actions land on the goal
+#   CHILDREN - the position each pawn action leads to, as a table index
+# Player 1 is never on row 8 and player 2 never on row 0, the game would be
+# over, so only POSSIBLE positions are solved.
+PLAYER1, PLAYER2 = (grid.ravel() for grid in np.meshgrid(np.arange(81), np.arange(81), indexing='ij'))
+POSSIBLE = (PLAYER1 < 72) & (PLAYER2 >= 9) & (PLAYER1 != PLAYER2)
+LOCATIONS = {1: PLAYER1, 2: PLAYER2}
+OPPONENTS = {1: PLAYER2, 2: PLAYER1}
+ADJACENT = {player: [np.array(NEIGHBOURS)[LOCATIONS[player], direction] == OPPONENTS[player]
+                     for direction in (NORTH, SOUTH, EAST, WEST)]
+            for player in (1, 2)}
+GOAL_JUMPS = {1: PLAYER2 > 71, 2: PLAYER1 < 9}
+_targets = {player: LOCATIONS[player][:, None] + np.array(PAWN_DELTAS) for player in (1, 2)}
+GOAL_MOVES = {1: _targets[1] > 71, 2: _targets[2] < 9}
+CHILDREN = {1: _index(2, _targets[1], PLAYER2[:, None]).astype(np.int32),
+            2: _index(1, PLAYER1[:, None], _targets[2]).astype(np.int32)}
+
+
+class EndgameTable:
+    """The result and length of every pawn race on one wall layout.
+
+    results and plies are indexed by (player to move - 1) * 6561 + player 1
+    tile * 81 + player 2 tile. plies counts moves to the end of the game
+    with the winner hurrying and the loser holding out, 0 for draws and for
+    positions that can't happen (a pawn already on its goal, both pawns on
+    one tile).
+    """
+
+    def __init__(self, results, plies):
+        self.results = results
+        self.plies = plies
+
+    def probe(self, player1, player2, player):
+        """(result, plies) for the player to move, given both pawn tiles."""
+        index = _index(player, player1, player2)
+        return int(self.results[index]), int(self.plies[index])
+
+
+def _pawn_moves(open_edges, player):
+    """Legal pawn actions in every position, as Quoridor._valid_pawn_actions.
+
+    Returns a (6561, 12) mask in table order, for player to move. Positions
+    that can't happen get moves too, they are left out later.
+    """
+    location, opponent = LOCATIONS[player], OPPONENTS[player]
+    moves = np.zeros([6561, 12], dtype=np.bool_)
+    for direction in (NORTH, SOUTH, EAST, WEST):
+        adjacent = open_edges[location, direction] & ADJACENT[player][direction]
+        moves[:, direction] = open_edges[location, direction] & ~adjacent
+
+        # Jumping over the opponent's pawn off the board reaches the goal
+        straight = open_edges[opponent, direction]
+        if (player, direction) in ((1, NORTH), (2, SOUTH)):
+            straight = straight | GOAL_JUMPS[player]
+        moves[:, STRAIGHT_JUMPS[direction]] |= adjacent & straight
+        for side in PERPENDICULAR[direction]:
+            moves[:, DIAGONAL_JUMPS[direction, side]] |= adjacent & open_edges[opponent, side]
+    return moves
+
+
+def solve(intersections):
+    """The EndgameTable for a wall layout, as Quoridor._intersections."""
+    walls = np.asarray(intersections).tolist()
+    game = Quoridor()
+    open_edges = np.array([[game._edge_open(walls, tile, direction) for direction in (NORTH, SOUTH, EAST, WEST)]
+                           for tile in range(81)])
+
+    # Two spare slots past the positions: one always DRAW for positions
+    # with no moves at all, and one always WIN, which unplayable moves lead
+    # to so they neither make a position a win nor stop it being a loss
+    spare_draw, spare_win = 2 * 6561, 2 * 6561 + 1
+    results = np.zeros(2 * 6561 + 2, dtype=np.int8)
+    results[spare_win] = WIN
+    plies = np.zeros(2 * 6561, dtype=np.int16)
+
+    unsolved = []
+    children = []
+    for player in (1, 2):
+        moves = _pawn_moves(open_edges, player)
+        goal = moves & GOAL_MOVES[player]
+        wins = goal.any(axis=1) & POSSIBLE
+        offset = (player - 1) * 6561
+        results[offset:offset + 6561][wins] = WIN
+        plies[offset:offset + 6561][wins] = 1
+
+        moves &= ~goal
+        child = np.where(moves, CHILDREN[player], spare_win)
+        child[~moves.any(axis=1), 0] = spare_draw
+        positions = np.flatnonzero(POSSIBLE & ~wins)
+        unsolved.append(positions + offset)
+        children.append(child[positions])
+
+    unsolved = np.concatenate(unsolved)
+    children = np.concatenate(children)
+    # Pawns have a handful of moves at most, so sort the unplayable ones
+    # (the highest index) to the end and drop them
+    children.sort(axis=1)
+    width = max(int((children != spare_win).sum(axis=1).max(initial=0)), 1)
+    children = children[:, :width]
+
+    # Positions solved a ply at a time from the previous ply's, so a win
+    # takes the quickest losing reply and a loss the slowest winning one
+    ply = 1
+    while unsolved.size:
+        ply += 1
+        # A losing reply makes a win, only winning replies a loss
+        best_reply = results[children].min(axis=1)
+        solved = best_reply != DRAW
+        if not solved.any():
+            break
+        positions = unsolved[solved]
+        results[positions] = -best_reply[solved]
+        plies[positions] = ply
+        unsolved = unsolved[~solved]
+        children = children[~solved]
+    return EndgameTable(results[:2 * 6561], plies)
+
+
+def layout_hash(game):
+    """Zobrist hash of the game's walls alone, the key tables are cached under.
+
+    Quoridor games take it out of their running hash, BitboardQuoridor games
+    from their wall bitmasks.
+    """
+    zobrist = getattr(game, 'zobrist_hash', None)
+    if zobrist is not None:
+        # Take everything else back out of the position's hash
+        key = (zobrist ^ ZOBRIST_PAWNS[1][game._positions[1]] ^ ZOBRIST_PAWNS[2][game._positions[2]]
+               ^ ZOBRIST_WALLS_REMAINING[1][game._player1_walls_remaining]
+               ^ ZOBRIST_WALLS_REMAINING[2][game._player2_walls_remaining])
+        return key ^ ZOBRIST_PLAYER2 if game.current_player == 2 else key
+
+    key = 0
+    for walls, offset in ((game._horizontal, 0), (game._vertical, 64)):
+        while walls:
+            bit = walls & -walls
+            key ^= ZOBRIST_WALLS[bit.bit_length() - 1 + offset]
+            walls ^= bit
+    return key
+
+
+def table(game, solve_missing=True):
+    """The EndgameTable for the game's wall layout, solved on first use.
+
+    With solve_missing False, a layout not solved yet gives None instead.
+    """
+    key = layout_hash(game)
+    endgame = _tables.get(key)
+    if endgame is None and solve_missing:
+        endgame = solve(game._intersections)
+        _tables.put(key, endgame)
+    return endgame
+
+
+def probe(game, solve_missing=True):
+    """(result, plies) for the player to move, or None while walls are left to place.
+
+    Works with Quoridor and BitboardQuoridor games. Finished games have no
+    result to probe either, nor (with solve_missing False) wall layouts
+    that haven't been solved yet.
+    """
+    if game._player1_walls_remaining or game._player2_walls_remaining or game.winner is not None:
+        return None
+    endgame = table(game, solve_missing)
+    if endgame is None:
+        return None
+    return endgame.probe(game._positions[1], game._positions[2], game.current_player)
+
+
+def best_action(game):
+    """The pawn move that keeps the best result, or None while walls are left to place.
+
+    A winning player picks the quickest win and a losing player the
+    slowest loss.
+    """
+    if probe(game) is None:
+        return None
+    endgame = table(game)
+    player = game.current_player
+    opponent = 3 - player
+    location = game._positions[player]
+    best = None
+    best_key = None
+    # With no walls left only pawn moves are legal
+    for action in game.actions:
+        target = location + PAWN_DELTAS[action]
+        if target > 71 if player == 1 else target < 9:
+            return action
+        if player == 1:
+            result, plies = endgame.probe(target, game._positions[2], opponent)
+        else:
+            result, plies = endgame.probe(game._positions[1], target, opponent)
+        # The opponent's loss is our win, shorter is better; their win is
+        # our loss, longer is better
+        key = (-result, -plies if result == LOSS else plies)
+        if best_key is None or key > best_key:
+            best, best_key = action, key
+    return best
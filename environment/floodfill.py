@@ -0,0 +1,127 @@
+import numpy as np
+
+# Vectorized wall legality.
+#
+# Boards are (..., 9, 9) boolean planes indexed [row, column], row 0 being the
+# south edge. Walls are described by two planes of open edges: north (the tile
+# can step to the row above) and east (the tile can step to the next column).
+# Walls are indexed like wall actions minus 12: 0-63 horizontal, 64-127
+# vertical, each over the 8x8 intersection grid.
+
+N_WALLS = 128
+
+# The edges each candidate wall closes
+NORTH_CUTS = np.zeros([N_WALLS, 9, 9], dtype=bool)
+EAST_CUTS = np.zeros([N_WALLS, 9, 9], dtype=bool)
+for _ix in range(64):
+    _row, _column = divmod(_ix, 8)
+    NORTH_CUTS[_ix, _row, _column:_column + 2] = True
+    EAST_CUTS[_ix + 64, _row:_row + 2, _column] = True
+
+# Goal rows, stacked by player (player 1 first)
+GOALS = np.zeros([2, 1, 9, 9], dtype=bool)
+GOALS[0, :, 8, :] = True
+GOALS[1, :, 0, :] = True
+
+
+def open_edges(intersections):
+    """The north and east open-edge planes for a (..., 64) intersection array."""
+    walls = np.asarray(intersections).reshape(np.shape(intersections)[:-1] + (8, 8))
+    horizontal = walls == 1
+    vertical = walls == -1
+
+    north = np.ones(walls.shape[:-2] + (9, 9), dtype=bool)
+    north[..., 8, :] = False
+    north[..., :8, :8] &= ~horizontal
+    north[..., :8, 1:] &= ~horizontal
+
+    east = np.ones(walls.shape[:-2] + (9, 9), dtype=bool)
+    east[..., :, 8] = False
+    east[..., :8, :8] &= ~vertical
+    east[..., 1:, :8] &= ~vertical
+    return north, east
+
+
+def free_walls(intersections):
+    """The (..., 128) mask of walls that don't overlap or cross a placed wall."""
+    walls = np.asarray(intersections).reshape(np.shape(intersections)[:-1] + (8, 8))
+    empty = walls == 0
+    horizontal = walls == 1
+    vertical = walls == -1
+
+    horizontal_free = empty.copy()
+    horizontal_free[..., :, 1:] &= ~horizontal[..., :, :-1]
+    horizontal_free[..., :, :-1] &= ~horizontal[..., :, 1:]
+
+    vertical_free = empty.copy()
+    vertical_free[..., 1:, :] &= ~vertical[..., :-1, :]
+    vertical_free[..., :-1, :] &= ~vertical[..., 1:, :]
+
+    shape = walls.shape[:-2] + (64,)
+    return np.concatenate([horizontal_free.reshape(shape), vertical_free.reshape(shape)], axis=-1)
+
+
+def pack_rows(planes):
+    """Packs (..., 9, 9) boolean planes into (..., 9) rows of uint16 bits."""
+    return np.packbits(planes, axis=-1, bitorder='little').view('<u2')[..., 0]
+
+
+def reachable(start, goal, north, east):
+    """Synchronous flood fill over a batch of boards.
+
+    Every board grows its reached set by one step per iteration until each
+    one has touched its goal or stopped growing. Returns a (...) boolean
+    array of which boards reached their goal.
+    """
+    # Each row is flooded as a 9-bit integer, so east / west moves are shifts
+    reach = pack_rows(start)
+    goal = np.broadcast_to(pack_rows(goal), reach.shape)
+    north = np.broadcast_to(pack_rows(north)[..., :-1], reach.shape[:-1] + (8,))
+    east = np.broadcast_to(pack_rows(east), reach.shape)
+
+    shape = reach.shape[:-1]
+    reach, goal, north, east = (array.reshape(-1, array.shape[-1]) for array in (reach, goal, north, east))
+    done = np.zeros(len(reach), dtype=bool)
+    active = np.arange(len(reach))
+
+    while active.size:
+        grown = reach | ((reach & east) << 1) | ((reach >> 1) & east)
+        grown[:, 1:] |= reach[:, :-1] & north
+        grown[:, :-1] |= reach[:, 1:] & north
+
+        arrived = (grown & goal).any(axis=-1)
+        # Drop boards that reached their goal or stopped growing
+        running = ~arrived & (grown != reach).any(axis=-1)
+        done[active[arrived]] = True
+        if not running.all():
+            active = active[running]
+            grown, goal, north, east = grown[running], goal[running], north[running], east[running]
+        reach = grown
+    return done.reshape(shape)
+
+
+def legal_walls(intersections, player1_position, player2_position, walls=None):
+    """The (128,) mask of legal wall placements for a single position.
+
+    Every free candidate is stacked into one batch of boards and both players
+    are flood filled at once. Only walls block a path, pawns do not. If walls
+    is given, only those candidates are checked and the rest are left False.
+    """
+    legal = np.zeros(N_WALLS, dtype=bool)
+    free = free_walls(intersections)
+    if walls is not None:
+        free &= np.isin(np.arange(N_WALLS), walls)
+    candidates = np.flatnonzero(free)
+    if candidates.size == 0:
+        return legal
+
+    north, east = open_edges(intersections)
+    north = north & ~NORTH_CUTS[candidates]
+    east = east & ~EAST_CUTS[candidates]
+
+    start = np.zeros([2, candidates.size, 9, 9], dtype=bool)
+    start[0, :, player1_position // 9, player1_position % 9] = True
+    start[1, :, player2_position // 9, player2_position % 9] = True
+
+    legal[candidates] = reachable(start, GOALS, north, east).all(axis=0)
+    return legal
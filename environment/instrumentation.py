@@ -0,0 +1,63 @@
+import time
+from collections import defaultdict
+from functools import wraps
+from inspect import getattr_static
+
+# Instrumented subclasses, made once per (class, names)
+_instrumented_classes = {}
+
+
+class Stats:
+    """Call counts and cumulative seconds for each instrumented method.
+
+    Times are inclusive, so a method called by another instrumented method
+    is counted in both.
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def snapshot(self):
+        """A plain dict of {name: {'calls': n, 'seconds': s}}, safe to serialize."""
+        return {name: {'calls': calls, 'seconds': self.seconds[name]} for name, calls in self.calls.items()}
+
+    def reset(self):
+        self.calls.clear()
+        self.seconds.clear()
+
+
+def _timed(name, function):
+    @wraps(function)
+    def timed(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            self.stats.calls[name] += 1
+            self.stats.seconds[name] += time.perf_counter() - start
+    return timed
+
+
+def instrumented(cls, names):
+    """A subclass of cls that times the named methods and properties.
+
+    Instances need a stats attribute holding a Stats. Only instrumented
+    instances pay for timing, the base class is left untouched.
+
+    The subclass is named Instrumented<cls name> and claims to live in cls's
+    module. For its instances to pickle, the module must bind it to that
+    name when imported, as environment.quoridor does for Quoridor.
+    """
+    key = (cls, tuple(names))
+    if key not in _instrumented_classes:
+        name = f'Instrumented{cls.__name__}'
+        namespace = {'__module__': cls.__module__, '__qualname__': name}
+        for attribute_name in names:
+            attribute = getattr_static(cls, attribute_name)
+            if isinstance(attribute, property):
+                namespace[attribute_name] = property(_timed(attribute_name, attribute.fget), attribute.fset)
+            else:
+                namespace[attribute_name] = _timed(attribute_name, attribute)
+        _instrumented_classes[key] = type(name, (cls,), namespace)
+    return _instrumented_classes[key]
@@ -0,0 +1,80 @@
+import os
+import time
+from multiprocessing import Pool
+
+from .perft import perft
+from .quoridor import Quoridor
+
+# Positions travel to worker processes as Quoridor.to_bytes (20 bytes each),
+# and every worker rebuilds its own game from them.
+
+
+def _analyse(job):
+    function, position, args, game_kwargs = job
+    game = Quoridor.from_bytes(position, **game_kwargs)
+    start = time.process_time()
+    result = function(game, *args)
+    return result, time.process_time() - start
+
+
+def map_positions(function, positions, args=(), workers=None, **game_kwargs):
+    """Runs function(game, *args) on every position across a process pool.
+
+    positions are to_bytes encodings and function must be picklable (defined
+    at module level). Keyword arguments are passed on to the Quoridor
+    constructor. Returns (result, CPU seconds) for each position, in order.
+    """
+    jobs = [(function, position, args, game_kwargs) for position in positions]
+    # Subtrees vary a lot in size, so hand out many small chunks of jobs
+    chunksize = max(1, len(jobs) // (32 * (workers or os.cpu_count())))
+    with Pool(workers) as pool:
+        return pool.map(_analyse, jobs, chunksize=chunksize)
+
+
+def split_positions(game, plies):
+    """(root action, to_bytes) for every position plies moves below the game.
+
+    Finished games are not expanded, they have no moves to split.
+    """
+    if plies == 0:
+        return [(None, game.to_bytes())]
+
+    positions = []
+    for action in game.actions:
+        game.push(action)
+        if plies == 1:
+            positions.append((action, game.to_bytes()))
+        elif game.winner is None:
+            positions.extend((action, position) for _, position in split_positions(game, plies - 1))
+        game.pop()
+    return positions
+
+
+def parallel_perft(game, depth, workers=None, split=1, **game_kwargs):
+    """perft with the subtrees split plies below the root spread across processes.
+
+    Returns a dict with the total nodes, the count per root move (as in
+    perft.divide), the wall clock seconds and the CPU seconds spent in
+    workers. A deeper split gives more, smaller jobs to balance across many
+    cores.
+    """
+    start = time.perf_counter()
+    split = min(split, depth)
+    if split == 0 or game.winner is not None:
+        return {'nodes': perft(game, depth), 'divide': {}, 'seconds': time.perf_counter() - start,
+                'worker_seconds': 0.0}
+
+    positions = split_positions(game, split)
+    results = map_positions(perft, [position for _, position in positions], (depth - split,), workers,
+                            **game_kwargs)
+
+    # Root moves that end the game have no positions below them to count
+    divide = dict.fromkeys(game.actions, 0)
+    for (action, _), (nodes, _) in zip(positions, results):
+        divide[action] += nodes
+    return {
+        'nodes': sum(divide.values()),
+        'divide': divide,
+        'seconds': time.perf_counter() - start,
+        'worker_seconds': sum(seconds for _, seconds in results),
+    }
@@ -0,0 +1,167 @@
+"""Move generation counts and speed.
+
+perft counts the leaf nodes of the game tree a fixed number of plies below a
+position. Any change to move generation that alters legality changes the
+counts, so they are checked against reference numbers for the start position
+and a few stored mid-game positions. Run as
+
+    python -m environment.perft --depth 2 --output results.json
+"""
+import argparse
+import json
+import sys
+import time
+
+from .quoridor import Quoridor
+
+# Stored positions, as Quoridor.to_bytes hex
+POSITIONS = {
+    'start': '044c00000000000000000000000000000000aa01',
+    'midgame': '0d4c014800040400040200414080860000022301',
+    'player2_to_move': '044c081004100020001000200400000604444302',
+    'walled_in': '044c002824100424488400060000818020001101',
+    'no_walls_left': '024e0000800200600248440460000a6240440001',
+    # Facing the opponent with walls behind it and to one side
+    'jump': '1f28000000000001800000010000000000009801',
+    # Player 1 can jump over the opponent off the board onto its goal
+    'goal_jump': '434c000010000000400000000000000080008901',
+}
+
+# Leaf counts by position and depth
+REFERENCE = {
+    'start': {1: 131, 2: 16677, 3: 2062264},
+    'midgame': {1: 82, 2: 6308, 3: 477008},
+    'player2_to_move': {1: 87, 2: 7277, 3: 584758},
+    'walled_in': {1: 70, 2: 4662, 3: 26828},
+    'no_walls_left': {1: 3, 2: 6, 3: 20},
+    'jump': {1: 116, 2: 13042, 3: 1420512},
+    'goal_jump': {1: 121, 2: 13842, 3: 1574621},
+}
+
+
+def perft(game, depth):
+    """Counts the leaf nodes depth plies below the game's position.
+
+    A finished game has no moves, so it only counts as a leaf at depth 0.
+    """
+    if depth == 0:
+        return 1
+    if game.winner is not None:
+        return 0
+
+    actions = game.actions
+    if depth == 1:
+        return len(actions)
+
+    nodes = 0
+    for action in actions:
+        game.push(action)
+        nodes += perft(game, depth - 1)
+        game.pop()
+    return nodes
+
+
+def divide(game, depth):
+    """perft split by root move, as a dict from action to leaf count."""
+    counts = {}
+    for action in game.actions:
+        game.push(action)
+        counts[action] = perft(game, depth - 1)
+        game.pop()
+    return counts
+
+
+def _rate(function, seconds):
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def benchmark(game, seconds=1.0):
+    """Calls per second of actions, step and state at the game's position."""
+    actions = game.actions
+    moves = iter(())
+
+    def step():
+        nonlocal moves
+        action = next(moves, None)
+        if action is None:
+            moves = iter(actions)
+            action = next(moves)
+        game.step(action)
+        game.pop()
+
+    return {
+        'actions': _rate(lambda: game.actions, seconds),
+        'step': _rate(step, seconds),
+        'state': _rate(lambda: game.state, seconds),
+    }
+
+
+def run(depth, names=None, seconds=1.0, workers=None, split=1, **game_kwargs):
+    """Counts and benchmarks stored positions up to depth.
+
+    Returns a result per position, with the count, the reference count (None
+    if there isn't one), the time taken and nodes per second at each depth.
+    With workers, counting is spread over that many processes (see
+    parallel.parallel_perft).
+    """
+    if workers is not None:
+        from .parallel import parallel_perft
+
+    results = {}
+    for name in names or POSITIONS:
+        game = Quoridor.from_bytes(bytes.fromhex(POSITIONS[name]), **game_kwargs)
+        depths = {}
+        for d in range(1, depth + 1):
+            start = time.perf_counter()
+            if workers is None:
+                nodes = perft(game, d)
+            else:
+                nodes = parallel_perft(game, d, workers, split, **game_kwargs)['nodes']
+            elapsed = time.perf_counter() - start
+            expected = REFERENCE.get(name, {}).get(d)
+            depths[d] = {
+                'nodes': nodes,
+                'expected': expected,
+                'ok': expected is None or nodes == expected,
+                'seconds': elapsed,
+                'nodes_per_second': nodes / elapsed if elapsed else None,
+            }
+        results[name] = {'perft': depths, 'calls_per_second': benchmark(game, seconds)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--positions', nargs='+', choices=sorted(POSITIONS), default=None)
+    parser.add_argument('--wall-strategy', choices=Quoridor.WALL_STRATEGIES, default='incremental')
+    parser.add_argument('--workers', type=int, default=None, help="count in this many processes")
+    parser.add_argument('--split', type=int, default=1, help="plies below the root to split work at")
+    parser.add_argument('--seconds', type=float, default=1.0, help="time spent benchmarking each call")
+    parser.add_argument('--output', help="JSON results file (default stdout)")
+    args = parser.parse_args(argv)
+
+    results = run(args.depth, args.positions, args.seconds, args.workers, args.split,
+                  wall_strategy=args.wall_strategy)
+
+    report = json.dumps({'depth': args.depth, 'wall_strategy': args.wall_strategy, 'workers': args.workers,
+                         'positions': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+    ok = all(result['ok'] for position in results.values() for result in position['perft'].values())
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
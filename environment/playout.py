@@ -0,0 +1,80 @@
+import random
+
+from . import endgame
+from .bitboard import BitboardQuoridor
+from .quoridor import PAWN_DELTAS
+
+# Light playout policies for pawn moves:
+#   random - a uniformly random legal pawn move
+#   shortest_path - a pawn move that gets closest to the goal (walls only
+#       count, pawns don't), or a random one with probability epsilon
+POLICIES = ('random', 'shortest_path')
+
+
+def playout(game, policy='shortest_path', wall_probability=0.0, epsilon=0.1, max_plies=1000, rng=random,
+            use_endgame=True):
+    """Plays a position out to the end of the game with a light policy.
+
+    Works on a bitboard copy, so game itself is left as it is. Each ply,
+    with probability wall_probability (and walls left), one randomly sampled
+    wall is tried and played if legal, without generating every legal wall.
+    Otherwise a pawn move is chosen by the policy.
+
+    With use_endgame, the playout stops as soon as neither player has walls
+    left, and the result of perfect play from there comes from the endgame
+    table (see environment.endgame).
+
+    Returns (winner, plies), winner being None if max_plies ran out first.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy}")
+
+    if isinstance(game, BitboardQuoridor):
+        board = game.clone()
+    else:
+        board = BitboardQuoridor.from_bytes(game.to_bytes())
+    positions = board._positions
+
+    plies = 0
+    done = board.winner is not None
+    while not done and plies < max_plies:
+        player = board.current_player
+        opponent = 1 if player == 2 else 2
+
+        if use_endgame and not board._player1_walls_remaining and not board._player2_walls_remaining:
+            result, remaining = endgame.probe(board)
+            if result == endgame.DRAW or plies + remaining > max_plies:
+                return None, max_plies
+            return (player if result == endgame.WIN else opponent), plies + remaining
+
+        action = None
+        if wall_probability and rng.random() < wall_probability:
+            walls = board._player1_walls_remaining if player == 1 else board._player2_walls_remaining
+            wall = rng.randrange(12, 140)
+            if walls > 0 and board.is_legal(wall):
+                action = wall
+
+        if action is None:
+            location = positions[player]
+            actions = board._valid_pawn_actions(location, positions[opponent], player)
+            if policy == 'random' or rng.random() < epsilon:
+                action = rng.choice(actions)
+            else:
+                distances = board._distance_map(player)
+                best = None
+                best_actions = []
+                for candidate in actions:
+                    target = location + PAWN_DELTAS[candidate]
+                    # Jumping off the board lands on the goal
+                    distance = distances[target] if 0 <= target < 81 else -1
+                    if best is None or distance < best:
+                        best = distance
+                        best_actions = [candidate]
+                    elif distance == best:
+                        best_actions.append(candidate)
+                action = rng.choice(best_actions)
+
+        _, done = board.push(action)
+        plies += 1
+
+    return board.winner, plies
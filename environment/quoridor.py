@@ -1,8 +1,135 @@
-import numpy as np
-import logwood
-from queue import Queue
+import random
+import struct
 
-# Helper class
+import numpy as np
+from collections import deque
+
+from .encoder import (HORIZONTAL_PLANE, N_PLANES, OPPONENT_PLANE, OPPONENT_WALLS_PLANES,
+                      PLAYER_PLANE, PLAYER_WALLS_PLANES, TURN_PLANE, VERTICAL_PLANE, encode_state)
+from .floodfill import legal_walls
+from .instrumentation import Stats, instrumented
+from .transposition import Entry
+
+# Tile offsets for each pawn action, indexed by action id
+PAWN_DELTAS = (9, -9, 1, -1, 18, -18, 2, -2, 10, 8, -8, -10)
+
+# Basic pawn directions, which are also the action ids of single steps
+NORTH, SOUTH, EAST, WEST = 0, 1, 2, 3
+
+# Moving onto the opponent's tile jumps it: straight on (action direction + 4),
+# or diagonally to either side
+STRAIGHT_JUMPS = (4, 5, 6, 7)
+PERPENDICULAR = {NORTH: (EAST, WEST), SOUTH: (EAST, WEST), EAST: (NORTH, SOUTH), WEST: (NORTH, SOUTH)}
+DIAGONAL_JUMPS = {
+    (NORTH, EAST): 8, (NORTH, WEST): 9, (SOUTH, EAST): 10, (SOUTH, WEST): 11,
+    (EAST, NORTH): 8, (EAST, SOUTH): 10, (WEST, NORTH): 9, (WEST, SOUTH): 11,
+}
+
+# Board geometry, computed once. For every tile and basic direction:
+#   NEIGHBOURS - the adjacent tile, or -1 past the edge of the board
+#   BLOCKERS - the (intersection, orientation) of each wall that closes that edge
+NEIGHBOURS = []
+BLOCKERS = []
+for _tile in range(81):
+    _row, _column = divmod(_tile, 9)
+    _neighbours = [-1, -1, -1, -1]
+    _blockers = [(), (), (), ()]
+    if _row < 8:
+        _neighbours[NORTH] = _tile + 9
+        _blockers[NORTH] = tuple((_row * 8 + column, 1) for column in (_column - 1, _column) if 0 <= column < 8)
+    if _row > 0:
+        _neighbours[SOUTH] = _tile - 9
+        _blockers[SOUTH] = tuple(((_row - 1) * 8 + column, 1) for column in (_column - 1, _column) if 0 <= column < 8)
+    if _column < 8:
+        _neighbours[EAST] = _tile + 1
+        _blockers[EAST] = tuple((row * 8 + _column, -1) for row in (_row - 1, _row) if 0 <= row < 8)
+    if _column > 0:
+        _neighbours[WEST] = _tile - 1
+        _blockers[WEST] = tuple((row * 8 + _column - 1, -1) for row in (_row - 1, _row) if 0 <= row < 8)
+    NEIGHBOURS.append(tuple(_neighbours))
+    BLOCKERS.append(tuple(_blockers))
+
+# Zobrist keys. Pawns can jump off the board onto their goal on the last move
+# of the game, so pawn keys cover tiles -9 to 89.
+_zobrist_random = random.Random(0x5155)
+ZOBRIST_PAWNS = {player: {tile: _zobrist_random.getrandbits(64) for tile in range(-9, 90)}
+                 for player in (1, 2)}
+ZOBRIST_WALLS = [_zobrist_random.getrandbits(64) for _ in range(128)]
+ZOBRIST_WALLS_REMAINING = {player: [_zobrist_random.getrandbits(64) for _ in range(11)]
+                           for player in (1, 2)}
+ZOBRIST_PLAYER2 = _zobrist_random.getrandbits(64)
+
+# Open edges as bits of a Python int (bit = tile): NORTH_EDGES for tile t to
+# t + 9 and EAST_EDGES for tile t to t + 1, before any wall is placed. The
+# edges a wall closes, by intersection, are its HORIZONTAL_CUTS (the north
+# edges of the two tiles below it) or VERTICAL_CUTS (the east edges of the
+# two tiles to its west).
+NORTH_EDGES = (1 << 72) - 1
+EAST_EDGES = sum(1 << tile for tile in range(81) if tile % 9 != 8)
+HORIZONTAL_CUTS = []
+VERTICAL_CUTS = []
+for _ix in range(64):
+    _tile = _ix + _ix // 8
+    HORIZONTAL_CUTS.append((1 << _tile) | (1 << (_tile + 1)))
+    VERTICAL_CUTS.append((1 << _tile) | (1 << (_tile + 9)))
+GOAL_ROWS = {1: 0x1FF << 72, 2: 0x1FF}
+
+
+def _expand(frontier, north, east):
+    """All tiles one open edge away from a set of tiles."""
+    return (((frontier & north) << 9) | ((frontier >> 9) & north)
+            | ((frontier & east) << 1) | ((frontier >> 1) & east))
+
+
+def _reaches(start, goal, north, east):
+    """Flood fill from start until it touches goal or stops growing."""
+    reach = start
+    while not reach & goal:
+        grown = reach | _expand(reach, north, east)
+        if grown == reach:
+            return False
+        reach = grown
+    return True
+
+
+def _grow_layers(layers, visited, north, east):
+    """Adds BFS layers after the last one until no new tile is reached."""
+    frontier = _expand(layers[-1], north, east) & ~visited
+    while frontier:
+        layers.append(frontier)
+        visited |= frontier
+        frontier = _expand(frontier, north, east) & ~visited
+    return layers
+
+
+def _fill_distances(distances, layers, start):
+    """Writes the distance of every tile in layers[start:] into distances."""
+    for distance in range(start, len(layers)):
+        tiles = layers[distance]
+        while tiles:
+            low = tiles & -tiles
+            distances[low.bit_length() - 1] = distance
+            tiles ^= low
+    return distances
+
+
+# Distance maps hold the steps from every tile to a player's goal row, with
+# only walls in the way, as (BFS layers from the goal row, distance of every
+# tile, north edges, east edges) for the open edges they were computed with.
+# Tiles cut off from the goal hold UNREACHABLE.
+UNREACHABLE = 81
+OPEN_BOARD_DISTANCES = {}
+for _player, _goal in GOAL_ROWS.items():
+    _layers = _grow_layers([_goal], _goal, NORTH_EDGES, EAST_EDGES)
+    OPEN_BOARD_DISTANCES[_player] = (_layers, _fill_distances([UNREACHABLE] * 81, _layers, 0), NORTH_EDGES,
+                                     EAST_EDGES)
+
+# Compact position encoding used by Quoridor.to_bytes: the pawn tiles of
+# players 1 and 2, the 64 intersections as 2-bit cells four to a byte (0 empty,
+# 1 horizontal, 2 vertical), both wall counts as nibbles (player 1 low) and
+# the player to move.
+POSITION_FORMAT = struct.Struct('<bb16sBB')
+WALL_CELL_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
 
 
 class Quoridor:
@@ -10,10 +137,32 @@ class Quoridor:
     HORIZONTAL = 1
     VERTICAL = -1
 
-    def __init__(self, safe=False):
-        self._logger = logwood.get_logger(f"{self.__class__.__name__}")
+    # How wall legality is checked:
+    #   incremental - path search only for walls crossing a cached shortest path
+    #   vectorized - one batched NumPy flood fill over every candidate wall
+    WALL_STRATEGIES = ('incremental', 'vectorized')
+
+    # Methods and properties timed when constructed with instrument=True
+    INSTRUMENTED = ('actions', 'legal_mask', 'step', 'push', 'state', '_valid_wall_mask',
+                    '_shortest_path', '_blocks_path')
+
+    def __init__(self, safe=False, wall_strategy='incremental', cache=None, instrument=False):
         self.safe = safe
 
+        # Instrumented games become a subclass with timed methods (see
+        # stats.snapshot()), so uninstrumented ones run the plain code
+        self.stats = None
+        if instrument:
+            self.__class__ = instrumented(self.__class__, self.INSTRUMENTED)
+            self.stats = Stats()
+
+        # Optional TranspositionCache shared by every game that uses it
+        self.cache = cache
+
+        if wall_strategy not in self.WALL_STRATEGIES:
+            raise ValueError(f"Unknown wall strategy: {wall_strategy}")
+        self.wall_strategy = wall_strategy
+
         self.action_space = 140 # 140 possible actions in total
         self.n_players = 2
         self.reset()
@@ -23,9 +172,6 @@ class Quoridor:
         self.current_player = 1
         self.last_player = -1
 
-        # Initialize Tiles
-        self.tiles = np.zeros(81)
-
         # Initialize Player Locations
         self._positions = {
             1 : 4,
@@ -52,92 +198,281 @@ class Quoridor:
         self._player1_walls_remaining = 10
         self._player2_walls_remaining = 10
 
+        # Cached shortest path for each player as (tiles, edges crossed)
+        self._paths = {1: None, 2: None}
+
+        # Open edges as bitmasks, see NORTH_EDGES and EAST_EDGES
+        self._north = NORTH_EDGES
+        self._east = EAST_EDGES
+
+        # Distance map for each player, brought up to date with the open
+        # edges when it's next asked for
+        self._distance_maps = OPEN_BOARD_DISTANCES.copy()
+
+        # Moves made with push / step, as the information pop needs to undo them
+        self._history = []
+
+        self._zobrist = self._compute_zobrist()
+
+    @property
+    def zobrist_hash(self):
+        """64-bit hash of the position, kept up to date move by move."""
+        return self._zobrist
+
+    def _compute_zobrist(self):
+        key = ZOBRIST_PAWNS[1][self._positions[1]] ^ ZOBRIST_PAWNS[2][self._positions[2]]
+        for ix, wall in enumerate(self._intersections):
+            if wall == self.HORIZONTAL:
+                key ^= ZOBRIST_WALLS[ix]
+            elif wall == self.VERTICAL:
+                key ^= ZOBRIST_WALLS[ix + 64]
+        key ^= ZOBRIST_WALLS_REMAINING[1][self._player1_walls_remaining]
+        key ^= ZOBRIST_WALLS_REMAINING[2][self._player2_walls_remaining]
+        if self.current_player == 2:
+            key ^= ZOBRIST_PLAYER2
+        return key
+
     @property
     def state(self):
         """Returns a set of 9x9 planes that represent the game state.
-        1. The current player position
-        2. The opponent position
-        3. Vertical Walls
-        4. Horizontal Walls
+        1. Vertical Walls
+        2. Horizontal Walls
+        3. The current player position
+        4. The opponent position
         5 - 14. Number of walls remaining for current player
         15 - 24. Number of walls remaining for opponent
         25. Whose turn it is (0 for player 1, 1 for player 2)
+
+        Use encoder.StateEncoder to encode into a reusable buffer instead.
         """
-        player1_position_plane = self.tiles.copy()
-        player1_position_plane[self._positions[1]] = 1
-        player1_position_plane = player1_position_plane.reshape([9, 9])
-
-        player2_position_plane = self.tiles.copy()
-        player2_position_plane[self._positions[2]] = 1
-        player2_position_plane = player2_position_plane.reshape([9, 9])
-
-        player1_walls_plane = np.zeros([10,9,9])
-        player2_walls_plane = np.zeros([10,9,9])
-
-        player1_walls_plane[self._player1_walls_remaining - 1, :, :] = 1
-        player2_walls_plane[self._player2_walls_remaining - 1, :, :] = 1
-
-        # Set the wall planes
-        vertical_walls = np.pad(
-            np.int8(self._intersections == -1).reshape([8, 8]),
-            (0, 1),
-            mode='constant',
-            constant_values=0
-            )
-
-
-        horizontal_walls = np.pad(
-            np.int8(self._intersections == 1).reshape([8, 8]),
-            (0, 1),
-            mode='constant',
-            constant_values=0
-            )
-
-        no_walls = np.pad(
-            np.int8(self._intersections == 0).reshape([8, 8]),
-            (0, 1),
-            mode='constant',
-            constant_values=0
-            )
-
-        # Adjust the position of planes based on current player
-        if self.current_player == 1:
-            state = np.stack([
-                no_walls,
-                vertical_walls,
-                horizontal_walls,
-                player1_position_plane,
-                player2_position_plane,
-            ])
+        return encode_state(self, np.zeros([N_PLANES, 9, 9]))
 
-            print(f'Shape is {state.shape}')
+    def load_state(self, state):
+        """Mutates the Quoridor object to match a given state.
 
-            current_player_plane = np.zeros([1, 9 ,9])
-            state = np.vstack([state, player1_walls_plane, player2_walls_plane, current_player_plane])
+        A pawn that has jumped off the board to win isn't on any plane, so
+        finished games can't be loaded this way.
+        """
+        state = np.asarray(state)
+        current_player = 2 if state[TURN_PLANE].any() else 1
+        opponent = 1 if current_player == 2 else 2
+
+        positions = {}
+        walls_remaining = {}
+        for player, pawn_plane, walls_planes in ((current_player, PLAYER_PLANE, PLAYER_WALLS_PLANES),
+                                                 (opponent, OPPONENT_PLANE, OPPONENT_WALLS_PLANES)):
+            tiles = np.flatnonzero(state[pawn_plane])
+            if tiles.size != 1:
+                raise ValueError(f"Expected one pawn for player {player}, found {tiles.size}")
+            positions[player] = int(tiles[0])
+
+            counts = np.flatnonzero(state[walls_planes:walls_planes + 10, 0, 0])
+            walls_remaining[player] = int(counts[0]) + 1 if counts.size else 0
+
+        intersections = np.zeros(64)
+        intersections[state[HORIZONTAL_PLANE, :8, :8].ravel() != 0] = self.HORIZONTAL
+        intersections[state[VERTICAL_PLANE, :8, :8].ravel() != 0] = self.VERTICAL
+
+        self._set_position(positions, intersections, walls_remaining, current_player)
+
+    def to_bytes(self):
+        """The position in POSITION_FORMAT.size (20) bytes. Restore it with from_bytes."""
+        cells = np.where(self._intersections == self.VERTICAL, 2, self._intersections).astype(np.uint8)
+        walls = (cells.reshape(16, 4) << WALL_CELL_SHIFTS).sum(axis=1, dtype=np.uint8)
+        return POSITION_FORMAT.pack(self._positions[1], self._positions[2], walls.tobytes(),
+                                    self._player1_walls_remaining | self._player2_walls_remaining << 4,
+                                    self.current_player)
+
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        """A new game at a position encoded by to_bytes.
+
+        Keyword arguments are passed on to the constructor.
+        """
+        game = cls(**kwargs)
+        game.load_bytes(data)
+        return game
+
+    def load_bytes(self, data):
+        """Mutates the Quoridor object to match a position encoded by to_bytes."""
+        player1, player2, walls, walls_remaining, current_player = POSITION_FORMAT.unpack(data)
+        cells = ((np.frombuffer(walls, dtype=np.uint8)[:, None] >> WALL_CELL_SHIFTS) & 3).ravel()
+        player1_walls, player2_walls = walls_remaining & 15, walls_remaining >> 4
+        if current_player not in (1, 2) or (cells == 3).any() or player1_walls > 10 or player2_walls > 10:
+            raise ValueError("Invalid position encoding")
+
+        intersections = np.zeros(64)
+        intersections[cells == 1] = self.HORIZONTAL
+        intersections[cells == 2] = self.VERTICAL
+        self._set_position({1: player1, 2: player2}, intersections, {1: player1_walls, 2: player2_walls},
+                           current_player)
+
+    def _set_position(self, positions, intersections, walls_remaining, current_player):
+        self._positions = {1: positions[1], 2: positions[2]}
+        self._intersections = intersections
+        self._player1_walls_remaining = walls_remaining[1]
+        self._player2_walls_remaining = walls_remaining[2]
+        self.current_player = current_player
+        self.last_player = 1 if current_player == 2 else 2
+
+        # Nothing carries over from the previous position
+        self._paths = {1: None, 2: None}
+        self._north, self._east = self._edge_masks()
+        self._distance_maps = {player: self._goal_distances(player) for player in (1, 2)}
+        self._history = []
+        self._zobrist = self._compute_zobrist()
 
-        if self.current_player == 2:
-            state = np.stack([
-                no_walls,
-                vertical_walls,
-                horizontal_walls,
-                player2_position_plane,
-                player1_position_plane,
-            ])
 
-            current_player_plane = np.ones([1, 9 ,9])
-            state = np.vstack([state, player2_walls_plane, player1_walls_plane, current_player_plane])
+    @property
+    def actions(self):
+        """The valid actions for the current gamestate"""
+        return np.flatnonzero(self.legal_mask()).tolist()
 
-        return state
+    def legal_mask(self, out=None):
+        """Boolean mask of which of the 140 actions are valid.
 
-    def load_state(self, state):
-        """Mutates the Quoridor object to match a given state"""
-        current_player = state[-1] == np.zeros([9, 9])
-        # TODO: Implement the rest of this
+        Fills out in place if given, otherwise allocates a new array.
+        """
+        if out is None:
+            out = np.zeros(self.action_space, dtype=np.bool_)
+        if self.cache is not None:
+            out[:] = self._cache_entry().legal_mask
+            return out
+        return self._fill_legal_mask(out)
+
+    def is_legal(self, action):
+        """Whether a single action is valid, without generating the others."""
+        if not 0 <= action < self.action_space:
+            return False
+        if self.cache is not None:
+            return bool(self._cache_entry().legal_mask[action])
 
+        player = self.current_player
+        if action < 12:
+            opponent = 1 if player == 2 else 2
+            return action in self._valid_pawn_actions(walls=self._intersections,
+                        location=self._positions[player],
+                        opponent_loc=self._positions[opponent], player=player)
+
+        if ((player == 1 and self._player1_walls_remaining == 0)
+            or (player == 2 and self._player2_walls_remaining == 0)):
+            return False
+        if self.wall_strategy == 'vectorized':
+            wall = action - 12
+            return bool(legal_walls(self._intersections, self._positions[1], self._positions[2], walls=[wall])[wall])
+        if action < 76:
+            return self._validate_horizontal(action - 12)
+        return self._validate_vertical(action - 76)
 
     @property
-    def actions(self):
-        """The valid actions for the current gamestate"""
+    def winner(self):
+        """The player who has reached their goal, or None while the game goes on."""
+        if self._positions[2] < 9:
+            return 2
+        if self._positions[1] > 71:
+            return 1
+        return None
+
+    @property
+    def distances(self):
+        """Shortest path lengths to the goal for players 1 and 2."""
+        if self.cache is not None:
+            return self._cache_entry().distances
+        return self._path_lengths()
+
+    def distance(self, player):
+        """Steps from the player's pawn to its goal row with only walls in the way.
+
+        None if the goal can't be reached, 0 once the pawn is on it.
+        """
+        location = self._positions[player]
+        if not 0 <= location < self.N_TILES:
+            return 0
+        tile = 1 << location
+        for distance, layer in enumerate(self._distance_layers(player)):
+            if layer & tile:
+                return distance
+        return None
+
+    def distance_map(self, player):
+        """Steps to the player's goal row from every tile, as a (9, 9) array.
+
+        Indexed [row, column] like the state planes, -1 where the goal can't
+        be reached. Only walls block, pawns are ignored.
+        """
+        distances = np.array(self._distance_list(player)).reshape(9, 9)
+        distances[distances == UNREACHABLE] = -1
+        return distances
+
+    def _distance_layers(self, player):
+        distance_map = self._distance_maps[player]
+        if distance_map[2] != self._north or distance_map[3] != self._east:
+            distance_map = self._update_distances(distance_map)
+            self._distance_maps[player] = distance_map
+        return distance_map[0]
+
+    def _distance_list(self, player):
+        layers = self._distance_layers(player)
+        _, distances, north, east = self._distance_maps[player]
+        if distances is None:
+            distances = _fill_distances([UNREACHABLE] * self.N_TILES, layers, 0)
+            self._distance_maps[player] = (layers, distances, north, east)
+        return distances
+
+    def _goal_distances(self, player):
+        """A player's distance map from scratch, by BFS out from the goal row."""
+        goal = GOAL_ROWS[player]
+        layers = _grow_layers([goal], goal, self._north, self._east)
+        return layers, None, self._north, self._east
+
+    def _update_distances(self, distance_map):
+        """Repairs a distance map after walls closed some of its open edges.
+
+        Closing an edge between tiles at distances d - 1 and d can't change
+        the distance of any tile nearer than d, so the BFS layers below the
+        nearest such edge are kept and only the ones beyond it are grown again.
+        The distance list is left to be filled in when it's asked for.
+        """
+        layers, distances, north, east = distance_map
+        closed_north = north & ~self._north
+        closed_east = east & ~self._east
+
+        visited = layers[0]
+        for cut in range(1, len(layers)):
+            near, far = layers[cut - 1], layers[cut]
+            if (closed_north & ((near & (far >> 9)) | (far & (near >> 9)))
+                    or closed_east & ((near & (far >> 1)) | (far & (near >> 1)))):
+                layers = _grow_layers(layers[:cut], visited, self._north, self._east)
+                return layers, None, self._north, self._east
+            visited |= far
+        return layers, distances, self._north, self._east
+
+    def _edge_masks(self):
+        """The open north and east edges with the walls on the board."""
+        north, east = NORTH_EDGES, EAST_EDGES
+        for ix in np.flatnonzero(self._intersections == self.HORIZONTAL).tolist():
+            north &= ~HORIZONTAL_CUTS[ix]
+        for ix in np.flatnonzero(self._intersections == self.VERTICAL).tolist():
+            east &= ~VERTICAL_CUTS[ix]
+        return north, east
+
+    def _cache_entry(self):
+        entry = self.cache.get(self._zobrist)
+        if entry is None:
+            legal_mask = self._fill_legal_mask(np.zeros(self.action_space, dtype=np.bool_))
+            legal_mask.flags.writeable = False
+            entry = Entry(legal_mask, self._path_lengths())
+            self.cache.put(self._zobrist, entry)
+        return entry
+
+    def _path_lengths(self):
+        lengths = []
+        for player in (1, 2):
+            tiles, edges = self._shortest_path(player)
+            lengths.append(None if edges is None else len(tiles) - 1)
+        return tuple(lengths)
+
+    def _fill_legal_mask(self, out):
         # --------
         # There are 64 possible horizontal wall placements and
         # 64 possible vertical wall placements.
@@ -157,94 +492,131 @@ class Quoridor:
         pawn_actions = self._valid_pawn_actions(location=location,
                         opponent_loc=opponent_loc, walls=walls, player=player)
 
+        out[:] = False
+        out[pawn_actions] = True
         if ((self.current_player == 1 and self._player1_walls_remaining > 0)
             or (self.current_player == 2 and self._player2_walls_remaining > 0)):
-            wall_actions = self._valid_wall_actions()
-
-            # Adjust for the pawn actions (which go up to 12)
-            wall_actions = [action + 12 for action in wall_actions]
-        else:
-            wall_actions = []
-        return pawn_actions + wall_actions
+            # Wall actions come after the 12 pawn actions
+            out[12:] = self._valid_wall_mask()
+        return out
 
     def step(self, action):
         """Take a step in the environment given the current action"""
-        self._logger.info(f"Player {self.current_player} chooses action {action}")
-        player = self.current_player
         if self.safe:
-            if not action in self.valid_actions:
+            if not self.is_legal(action):
                 raise ValueError(f"Invalid Action: {action}")
 
+        rewards, done = self.push(action)
+        if done:
+            observation = None
+        else:
+            observation = self.state
+
+        return observation, rewards, done
+
+    def push(self, action):
+        """Make a move without building an observation. Undo it with pop.
+
+        Returns the rewards and whether the game is over. The turn only
+        passes to the other player if the game continues, as in step.
+        """
+        player = self.current_player
+        self._history.append((action, player, self._positions[player], self._paths.copy(),
+                              self._distance_maps.copy(), self.last_player, self._zobrist))
+
         if action < 12:
             self._handle_pawn_action(action, player)
         else:
             self._handle_wall_action(action - 12)
 
         rewards, done = self._get_rewards()
-        if done:
-            observation = None
-        else:
+        if not done:
             self.rotate_players()
-            observation = self.get_state
+        return rewards, done
 
-        return observation, rewards, done
+    def pop(self):
+        """Undo the last move made with push or step."""
+        action, player, position, paths, distance_maps, last_player, zobrist = self._history.pop()
+
+        if action < 12:
+            self._positions[player] = position
+        else:
+            ix = (action - 12) % 64
+            self._intersections[ix] = 0
+            # Every edge is closed by at most one wall, so it's open again
+            if action < 76:
+                self._north |= HORIZONTAL_CUTS[ix]
+            else:
+                self._east |= VERTICAL_CUTS[ix]
+            if player == 1:
+                self._player1_walls_remaining += 1
+            else:
+                self._player2_walls_remaining += 1
+
+        self._paths = paths
+        self._distance_maps = distance_maps
+        self._zobrist = zobrist
+        self.current_player = player
+        self.last_player = last_player
+        return action
 
     def _get_rewards(self):
+        """Rewards for players 1 and 2, +1 to the winner and -1 to the loser, and whether the game is over."""
         done = True
         if self._positions[2] < 9:
-            rewards, done = (1, -1)
-        elif self._positions[1] > 71:
             rewards = (-1, 1)
+        elif self._positions[1] > 71:
+            rewards = (1, -1)
         else:
             rewards = (0, 0)
             done = False
         return rewards, done
 
     def _handle_pawn_action(self, action, player):
-        if action == self._DIRECTIONS['N']:
-            self._positions[player] += 9
-        elif action == self._DIRECTIONS['S']:
-            self._positions[player] -= 9
-        elif action == self._DIRECTIONS['E']:
-            self._positions[player] += 1
-        elif action == self._DIRECTIONS['W']:
-            self._positions[player] -= 1
-        elif action == self._DIRECTIONS['NN']:
-            self._positions[player] += 18
-        elif action == self._DIRECTIONS['SS']:
-            self._positions[player] -= 18
-        elif action == self._DIRECTIONS['EE']:
-            self._positions[player] += 2
-        elif action == self._DIRECTIONS['WW']:
-            self._positions[player] -= 2
-        elif action == self._DIRECTIONS['NW']:
-            self._positions[player] += 8
-        elif action == self._DIRECTIONS['NE']:
-            self._positions[player] += 10
-        elif action == self._DIRECTIONS['SW']:
-            self._positions[player] -= 10
-        elif action == self._DIRECTIONS['SE']:
-            self._positions[player] -= 8
-        else:
+        previous = self._positions[player]
+        self._move_pawn(action, player)
+        self._repair_paths(player)
+
+        pawn_keys = ZOBRIST_PAWNS[player]
+        self._zobrist ^= pawn_keys[previous] ^ pawn_keys[self._positions[player]]
+
+    def _move_pawn(self, action, player):
+        if not 0 <= action < 12:
             raise ValueError(f"Invalid Pawn Action: {action}")
+        self._positions[player] += PAWN_DELTAS[action]
 
     def _handle_wall_action(self, action):
         # Action values less than 64 are horizontal walls
         if action < 64:
             self._intersections[action] = 1
+            self._north &= ~HORIZONTAL_CUTS[action]
+            blocked = self._wall_edges(action, self.HORIZONTAL)
         # Action values above 64 are vertical walls
         else:
             self._intersections[action - 64] = -1
+            self._east &= ~VERTICAL_CUTS[action - 64]
+            blocked = self._wall_edges(action - 64, self.VERTICAL)
 
+        # A shortest path the wall doesn't cross is still a shortest path
+        for player, path in self._paths.items():
+            if path is not None and (path[1] is None or not blocked.isdisjoint(path[1])):
+                self._paths[player] = None
+
+        self._zobrist ^= ZOBRIST_WALLS[action]
         if self.current_player == 1:
+            remaining_keys = ZOBRIST_WALLS_REMAINING[1]
+            self._zobrist ^= remaining_keys[self._player1_walls_remaining]
             self._player1_walls_remaining -= 1
+            self._zobrist ^= remaining_keys[self._player1_walls_remaining]
         else:
+            remaining_keys = ZOBRIST_WALLS_REMAINING[2]
+            self._zobrist ^= remaining_keys[self._player2_walls_remaining]
             self._player2_walls_remaining -= 1
-        self._logger.info(self._intersections)
+            self._zobrist ^= remaining_keys[self._player2_walls_remaining]
 
     def rotate_players(self):
         """Switch the player turn"""
-        self._logger.debug("Rotating Player")
+        self._zobrist ^= ZOBRIST_PLAYER2
         if self.current_player == 1:
             self.current_player = 2
             self.last_player = 1
@@ -255,265 +627,203 @@ class Quoridor:
 
 
     def _valid_pawn_actions(self, walls, location, opponent_loc, player=1):
-        HORIZONTAL = 1
-        VERTICAL = -1
-
         valid = []
+        for direction in (NORTH, SOUTH, EAST, WEST):
+            if not self._edge_open(walls, location, direction):
+                continue
 
-        opponent_north = location == opponent_loc - 9
-        opponent_south = location == opponent_loc + 9
-        opponent_east = location == opponent_loc - 1
-        opponent_west = location == opponent_loc + 1
-
-        current_row = location // self.N_ROWS
-
-        intersections = self._get_intersections(walls, location)
-
-        n = intersections['NW'] != HORIZONTAL and intersections['NE'] != HORIZONTAL and not opponent_north
-        s = intersections['SW'] != HORIZONTAL and intersections['SE'] != HORIZONTAL and not opponent_south
-        e = intersections['NE'] != VERTICAL and intersections['SE'] != VERTICAL and not opponent_east
-        w = intersections['NW'] != VERTICAL and intersections['SW'] != VERTICAL and not opponent_west
-
-        if n or (player == 1 and current_row == 8) : valid.append(self._DIRECTIONS['N'])
-        if s or (player == 2 and current_row == 0): valid.append(self._DIRECTIONS['S'])
-        if e : valid.append(self._DIRECTIONS['E'])
-        if w : valid.append(self._DIRECTIONS['W'])
-
-
-        if opponent_north and intersections['NE'] != HORIZONTAL and intersections['NW'] != HORIZONTAL:
-            n_intersections = self._get_intersections(walls, opponent_loc)
-            if n_intersections['NW'] != HORIZONTAL and n_intersections['NE'] != HORIZONTAL \
-                or (current_row == 7 and player == 1):
-                valid.append(self._DIRECTIONS['NN'])
-
-            if n_intersections['NE'] != VERTICAL and intersections['NE'] != VERTICAL:
-                valid.append(self._DIRECTIONS['NE'])
-
-            if n_intersections['NW'] != VERTICAL and intersections['NW'] != VERTICAL:
-                valid.append(self._DIRECTIONS['NW'])
-
-
-        elif opponent_south and intersections['SE'] != HORIZONTAL and intersections['SW'] != HORIZONTAL:
-            s_intersections = self._get_intersections(walls, opponent_loc)
-            if s_intersections['SW'] != HORIZONTAL and s_intersections['SE'] != HORIZONTAL \
-                or (current_row == 1 and player == 2):
-                valid.append(self._DIRECTIONS['SS'])
-
-            if s_intersections['SE'] != VERTICAL and intersections['SE'] != VERTICAL:
-                valid.append(self._DIRECTIONS['SE'])
-
-            if s_intersections['SW'] != VERTICAL and intersections['SW'] != VERTICAL:
-                valid.append(self._DIRECTIONS['SW'])
-
-
-        elif opponent_east and intersections['SE'] != VERTICAL and intersections['NE'] != VERTICAL:
-            e_intersections = self._get_intersections(walls, opponent_loc)
-            if e_intersections['SE'] != VERTICAL and e_intersections['NE'] != VERTICAL:
-                valid.append(self._DIRECTIONS['EE'])
-
-            if e_intersections['NE'] != HORIZONTAL:
-                valid.append(self._DIRECTIONS['NE'])
-
-            if e_intersections['SE'] != HORIZONTAL:
-                valid.append(self._DIRECTIONS['SE'])
+            if NEIGHBOURS[location][direction] != opponent_loc:
+                valid.append(direction)
+                continue
 
+            # Jumping over the opponent's pawn off the board reaches the goal
+            goal_jump = ((player == 1 and direction == NORTH and opponent_loc > 71)
+                         or (player == 2 and direction == SOUTH and opponent_loc < 9))
+            if goal_jump or self._edge_open(walls, opponent_loc, direction):
+                valid.append(STRAIGHT_JUMPS[direction])
 
-        elif opponent_west and intersections['SW'] != VERTICAL and intersections['NW'] != VERTICAL:
-            w_intersections = self._get_intersections(walls, opponent_loc)
-            if w_intersections['NW'] != VERTICAL and w_intersections['SW'] != VERTICAL:
-                valid.append(self._DIRECTIONS['WW'])
-
-            if w_intersections['NW'] != HORIZONTAL:
-                valid.append(self._DIRECTIONS['NW'])
-
-            if w_intersections['SW'] != HORIZONTAL:
-                valid.append(self._DIRECTIONS['SW'])
+            for side in PERPENDICULAR[direction]:
+                if self._edge_open(walls, opponent_loc, side):
+                    valid.append(DIAGONAL_JUMPS[direction, side])
 
         return valid
 
 
-    def _get_intersections(self, intersections, current_tile):
-        """Gets the four intersections for a given tile."""
-        location_row = current_tile // self.N_ROWS
-
-        n_border = current_tile > 71
-        e_border = current_tile % 9 == 8
-        s_border = current_tile < 9
-        w_border = current_tile % 9 == 0
-
-        if n_border:
-            ne_intersection = 1
-            if w_border:
-                nw_intersection = -1
-                sw_intersection = -1
-                se_intersection = intersections[(current_tile - 9) - (location_row - 1)]
-            elif e_border:
-                nw_intersection = 1
-                se_intersection = -1
-                sw_intersection = intersections[(current_tile - 9) - (location_row - 1) - 1]
-            else:
-                nw_intersection = 1
-                sw_intersection = intersections[(current_tile - 9) - (location_row - 1) - 1]
-                se_intersection = intersections[(current_tile - 9) - (location_row - 1)]
-        elif s_border:
-            sw_intersection = 1
-            if w_border:
-                nw_intersection = -1
-                se_intersection = 1
-                ne_intersection = intersections[current_tile - location_row]
-            elif e_border:
-                se_intersection = -1
-                ne_intersection = -1
-                nw_intersection = ne_intersection = intersections[current_tile - location_row - 1]
-            else:
-                se_intersection = 1
-                ne_intersection = intersections[current_tile - location_row]
-                nw_intersection = ne_intersection = intersections[current_tile - location_row - 1]
-
-
-        # West but not north or south
-        elif w_border:
-            nw_intersection = -1
-            sw_intersection = -1
-            ne_intersection = intersections[current_tile - location_row]
-            se_intersection = intersections[(current_tile - 9) - (location_row - 1)]
+    def _edge_open(self, walls, tile, direction):
+        """Whether a pawn can step from a tile in a basic direction."""
+        if NEIGHBOURS[tile][direction] < 0:
+            return False
+        for intersection, orientation in BLOCKERS[tile][direction]:
+            if walls[intersection] == orientation:
+                return False
+        return True
 
-        elif e_border:
-            ne_intersection = -1
-            se_intersection = -1
-            nw_intersection = intersections[current_tile - location_row - 1]
-            sw_intersection = intersections[(current_tile - 9) - (location_row - 1) - 1]
 
-        # No borders
-        else:
-            ne_intersection = intersections[current_tile - location_row]
-            nw_intersection = intersections[current_tile - location_row - 1]
-            sw_intersection = intersections[(current_tile - 9) - (location_row - 1) - 1]
-            se_intersection = intersections[(current_tile - 9) - (location_row - 1)]
+    def _valid_wall_actions(self):
+        return np.flatnonzero(self._valid_wall_mask()).tolist()
 
-        self._logger.debug(ne_intersection)
-        return {'NW' : nw_intersection,
-                'NE' : ne_intersection,
-                'SE' : se_intersection,
-                'SW' : sw_intersection}
 
+    def _valid_wall_mask(self):
+        """Mask over the 128 walls, horizontal walls first."""
+        if self.wall_strategy == 'vectorized':
+            return legal_walls(self._intersections, self._positions[1], self._positions[2])
 
-    def _valid_wall_actions(self):
-        valid = []
-        # If
+        valid = np.zeros(128, dtype=np.bool_)
         for ix in range(self._intersections.size):
-            if self._validate_horizontal(ix):
-                valid.append(ix)
-
-            if self._validate_vertical(ix):
-                valid.append(ix + 64)
+            valid[ix] = self._validate_horizontal(ix)
+            valid[ix + 64] = self._validate_vertical(ix)
 
         return valid
 
 
     def _validate_horizontal(self, ix):
-        column = ix % 8
+        if not self._wall_fits(ix, self.HORIZONTAL):
+            return False
+        return not self._blocks_path(ix, self.HORIZONTAL)
+
+
+    def _validate_vertical(self, ix):
+        if not self._wall_fits(ix, self.VERTICAL):
+            return False
+        return not self._blocks_path(ix, self.VERTICAL)
+
 
+    def _wall_fits(self, ix, orientation):
+        """Whether a wall is clear of every placed wall, ignoring paths."""
         if self._intersections[ix] != 0:
             return False
 
-        if column != 0:
-            if self._intersections[ix - 1] == 1:
+        if orientation == self.HORIZONTAL:
+            column = ix % 8
+            if column != 0 and self._intersections[ix - 1] == 1:
                 return False
-
-        if column != 7:
-            if self._intersections[ix + 1] == 1:
+            if column != 7 and self._intersections[ix + 1] == 1:
                 return False
+        else:
+            row = ix // 8
+            if row != 0 and self._intersections[ix - 8] == -1:
+                return False
+            if row != 7 and self._intersections[ix + 8] == -1:
+                return False
+        return True
 
-        return not self._blocks_path(ix, self.HORIZONTAL)
 
+    def _wall_edges(self, wall_location, orientation):
+        """The pairs of adjacent tiles a wall separates."""
+        # Tile to the south west of the intersection
+        tile = wall_location + wall_location // 8
+        if orientation == self.HORIZONTAL:
+            return {(tile, tile + 9), (tile + 1, tile + 10)}
+        return {(tile, tile + 1), (tile + 9, tile + 10)}
 
-    def _validate_vertical(self, ix):
-        row = ix // 8
-        if self._intersections[ix] != 0:
-            return False
 
-        if row != 0:
-            if self._intersections[ix - 8] == -1:
-                return False
+    def _shortest_path(self, player):
+        """A shortest path for the player to its goal row.
 
-        if row != 7:
-            if self._intersections[ix + 8] == -1:
-                return False
+        Returns the list of tiles visited and the set of edges crossed, where
+        jumps cross the two edges through the opponent's tile. The edges are
+        None if the goal is unreachable.
+        """
+        if self._paths[player] is not None:
+            return self._paths[player]
 
-        return not self._blocks_path(ix, self.VERTICAL)
+        opponent = 1 if player == 2 else 2
+        location = self._positions[player]
+        opponent_loc = self._positions[opponent]
+        target_row = 8 if player == 1 else 0
+
+        parents = {location: None}
+        visit_queue = deque([location])
+        tiles = None
+        while tiles is None and visit_queue:
+            current_position = visit_queue.popleft()
+            valid_directions = self._valid_pawn_actions(self._intersections,
+                                    location=current_position,
+                                    opponent_loc=opponent_loc,
+                                    player=player)
+            for direction in valid_directions:
+                new_position = current_position + PAWN_DELTAS[direction]
+                if not 0 <= new_position < self.N_TILES or new_position in parents:
+                    continue
+                parents[new_position] = current_position
+
+                if new_position // self.N_ROWS == target_row:
+                    tiles = [new_position]
+                    while parents[tiles[-1]] is not None:
+                        tiles.append(parents[tiles[-1]])
+                    tiles.reverse()
+                    break
+                visit_queue.append(new_position)
+
+        if tiles is None:
+            self._paths[player] = ([location], None)
+        else:
+            self._paths[player] = (tiles, self._trace_path(tiles, opponent_loc))
+        return self._paths[player]
 
 
-    def _blocks_path(self, wall_location, orientation):
-        player1_target = 8
-        player2_target = 0
+    def _trace_path(self, tiles, opponent_loc):
+        """The edges crossed walking along a list of tiles."""
+        edges = set()
+        for current_position, new_position in zip(tiles, tiles[1:]):
+            if abs(new_position - current_position) in (1, 9):
+                steps = [(current_position, new_position)]
+            else:
+                # Jumps pass through the opponent's tile
+                steps = [(current_position, opponent_loc), (opponent_loc, new_position)]
+            for a, b in steps:
+                edges.add((min(a, b), max(a, b)))
+        return edges
+
 
-        player1_position = self._positions[1]
-        player2_position = self._positions[2]
+    def _repair_paths(self, player):
+        """Keeps the cached shortest paths valid after a pawn move."""
+        opponent = 1 if player == 2 else 2
+        location = self._positions[player]
 
-        intersections = self._intersections.copy()
-        intersections[wall_location] = orientation
+        # Stepping along the path leaves the rest of it a shortest path
+        path = self._paths[player]
+        if path is not None:
+            tiles, edges = path
+            if edges is not None and len(tiles) > 1 and tiles[1] == location:
+                tiles = tiles[1:]
+                self._paths[player] = (tiles, self._trace_path(tiles, self._positions[opponent]))
+            else:
+                self._paths[player] = None
 
-        # BFS to target row
-        player1_valid = self._bfs_to_goal(intersections, player1_target, player1_position, player2_position, player=1)
-        player2_valid = self._bfs_to_goal(intersections, player2_target, player2_position, player1_position, player=2)
+        # The move can open a shorter route for the opponent (a jump, or a
+        # tile the pawn no longer blocks) anywhere, so theirs is found again
+        self._paths[opponent] = None
 
-        return not (player1_valid and player2_valid)
 
+    def _blocks_path(self, wall_location, orientation):
+        """Whether a wall would cut either player off from their goal row.
 
-    def _bfs_to_goal(self, intersections, target_row, player_position, opponent_position, player=1):
-        visited = []
-        invalid_rows = [9, -1]
-        visit_queue = Queue()
-        visit_queue.put(player_position)
-        target_visited = False
+        Only the players whose cached shortest path the wall crosses can be
+        cut off, and for them a flood fill over the open edge masks (only
+        walls block, pawns don't) settles it.
+        """
+        blocked = self._wall_edges(wall_location, orientation)
+        north, east = self._north, self._east
+        if orientation == self.HORIZONTAL:
+            north &= ~HORIZONTAL_CUTS[wall_location]
+        else:
+            east &= ~VERTICAL_CUTS[wall_location]
 
-        while not target_visited and not visit_queue.empty():
-            current_position = visit_queue.get()
-            valid_directions = self._valid_pawn_actions(intersections,
-                                    location=current_position,
-                                    opponent_loc=opponent_position,
-                                    player=player)
-            for direction in valid_directions:
-                if direction == self._DIRECTIONS['N']:
-                    new_position = current_position + 9
-                elif direction == self._DIRECTIONS['S']:
-                    new_position = current_position - 9
-                elif direction == self._DIRECTIONS['E']:
-                    new_position = current_position + 1
-                elif direction == self._DIRECTIONS['W']:
-                    new_position = current_position - 1
-                elif direction == self._DIRECTIONS['NN']:
-                    new_position = current_position + 18
-                elif direction == self._DIRECTIONS['SS']:
-                    new_position = current_position - 18
-                elif direction == self._DIRECTIONS['EE']:
-                    new_position = current_position + 2
-                elif direction == self._DIRECTIONS['WW']:
-                    new_position = current_position - 2
-                elif direction == self._DIRECTIONS['NE']:
-                    new_position = current_position + 10
-                elif direction == self._DIRECTIONS['NW']:
-                    new_position = current_position + 8
-                elif direction == self._DIRECTIONS['SW']:
-                    new_position = current_position - 10
-                elif direction == self._DIRECTIONS['SE']:
-                    new_position = current_position - 8
-                else:
-                    raise ValueError('Invalid direction - should never happen')
-
-                new_row = new_position // self.N_ROWS
-                if new_row == target_row:
-                    target_visited = True
-                elif new_position not in visited:
-                    visited.append(new_position)
-                    if new_row not in invalid_rows:
-                        visit_queue.put(new_position)
-
-        return target_visited
+        for player in (1, 2):
+            edges = self._shortest_path(player)[1]
+            if edges is not None and blocked.isdisjoint(edges):
+                continue
+            if not _reaches(1 << self._positions[player], GOAL_ROWS[player], north, east):
+                return True
+        return False
 
     def add_wall(self, wall, orientation):
         self._intersections[wall] = orientation
+        self._paths = {1: None, 2: None}
+        self._north, self._east = self._edge_masks()
+        self._distance_maps = {player: self._goal_distances(player) for player in (1, 2)}
+        self._zobrist = self._compute_zobrist()
 
     def print_board(self):
         player1_row = self._positions[1] // 9
@@ -554,4 +864,21 @@ class Quoridor:
                 print()
 
     def clone(self):
-        return Quoridor()
+        """A copy of the current position.
+
+        Only the position itself is copied, so the clone starts with an empty
+        move history. Clones of an instrumented game add to the same stats.
+        """
+        game = self.__class__.__new__(self.__class__)
+        game.__dict__.update(self.__dict__)
+        game._positions = self._positions.copy()
+        game._intersections = self._intersections.copy()
+        game._paths = self._paths.copy()
+        game._distance_maps = self._distance_maps.copy()
+        game._history = []
+        return game
+
+
+# Quoridor(instrument=True) games are instances of this class, bound here so
+# they can be pickled (to send to process pools, for example)
+InstrumentedQuoridor = instrumented(Quoridor, Quoridor.INSTRUMENTED)
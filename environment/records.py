@@ -0,0 +1,191 @@
+import mmap
+import os
+import struct
+from collections import namedtuple
+from glob import glob
+
+import numpy as np
+
+from .quoridor import Quoridor
+
+# Game record shards.
+#
+# A shard starts with a file header (magic, format version) followed by games
+# back to back. Each game is a little-endian uint16 ply count, one byte per
+# ply holding the action (0-139) and one result byte: the winning player, or
+# 0 for an unfinished game. Every shard has a companion .idx file of uint64
+# offsets of each game, for random access.
+
+MAGIC = b'QREC'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sB')
+GAME_HEADER = struct.Struct('<H')
+OFFSET = struct.Struct('<Q')
+
+SHARD_SUFFIX = '.qrec'
+INDEX_SUFFIX = '.idx'
+
+GameRecord = namedtuple('GameRecord', ['moves', 'winner'])
+
+
+def shard_paths(directory, prefix='games'):
+    """The shard files written by GameWriter in a directory, in order."""
+    return sorted(glob(os.path.join(directory, f'{prefix}-*{SHARD_SUFFIX}')))
+
+
+def iter_games(directory, prefix='games'):
+    """Every game in every shard of a directory."""
+    for path in shard_paths(directory, prefix):
+        with GameReader(path) as reader:
+            yield from reader
+
+
+def replay(record, game=None):
+    """Plays a record's moves on a new (or given) game and returns it.
+
+    Raises ValueError if the game doesn't end the way the record says.
+    """
+    if game is None:
+        game = Quoridor()
+    for move in record.moves:
+        game.push(move)
+    if game.winner != record.winner:
+        raise ValueError(f"Replay ended with winner {game.winner}, record says {record.winner}")
+    return game
+
+
+class GameWriter:
+    """Appends games to sharded record files.
+
+    Starts a new shard after the last one already in the directory and
+    every games_per_shard games after that.
+    """
+
+    def __init__(self, directory, prefix='games', games_per_shard=2 ** 16):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.games_per_shard = games_per_shard
+
+        existing = shard_paths(directory, prefix)
+        if existing:
+            last = os.path.basename(existing[-1])[len(prefix) + 1:-len(SHARD_SUFFIX)]
+            self._shard_number = int(last) + 1
+        else:
+            self._shard_number = 0
+
+        self._file = None
+        self._index = None
+        self._games_in_shard = 0
+
+    def write(self, moves, winner=None):
+        """Appends one game, given its actions in order and the winner."""
+        moves = bytes(moves)
+        if moves and max(moves) >= 140:
+            raise ValueError(f"Invalid Action: {max(moves)}")
+        if winner not in (None, 1, 2):
+            raise ValueError(f"Invalid Winner: {winner}")
+
+        if self._file is None or self._games_in_shard >= self.games_per_shard:
+            self._open_shard()
+
+        self._index.write(OFFSET.pack(self._file.tell()))
+        self._file.write(GAME_HEADER.pack(len(moves)))
+        self._file.write(moves)
+        self._file.write(bytes([winner or 0]))
+        self._games_in_shard += 1
+
+    def write_game(self, game):
+        """Appends a Quoridor game from its move history."""
+        self.write([move[0] for move in game._history], game.winner)
+
+    def _open_shard(self):
+        self._close_shard()
+        path = os.path.join(self.directory, f'{self.prefix}-{self._shard_number:05d}{SHARD_SUFFIX}')
+        self._shard_number += 1
+
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._index = open(path[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX, 'wb')
+        self._games_in_shard = 0
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+
+    def close(self):
+        self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameReader:
+    """Reads games from one shard through a memory map.
+
+    Iterating decodes games lazily, and reader[k] seeks straight to game k
+    using the shard's offset index (rebuilt by scanning if it is missing).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = FILE_HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Not a version {VERSION} game record: {path}")
+        self._offsets = None
+
+    def _read(self, offset):
+        n_plies, = GAME_HEADER.unpack_from(self._mmap, offset)
+        start = offset + GAME_HEADER.size
+        moves = self._mmap[start:start + n_plies]
+        winner = self._mmap[start + n_plies]
+        return GameRecord(moves, winner or None), start + n_plies + 1
+
+    def __iter__(self):
+        offset = FILE_HEADER.size
+        while offset < len(self._mmap):
+            record, offset = self._read(offset)
+            yield record
+
+    @property
+    def offsets(self):
+        """The byte offset of every game in the shard."""
+        if self._offsets is None:
+            index_path = self.path[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX
+            if os.path.exists(index_path):
+                self._offsets = np.fromfile(index_path, dtype='<u8')
+            else:
+                offsets = []
+                offset = FILE_HEADER.size
+                while offset < len(self._mmap):
+                    offsets.append(offset)
+                    n_plies, = GAME_HEADER.unpack_from(self._mmap, offset)
+                    offset += GAME_HEADER.size + n_plies + 1
+                self._offsets = np.array(offsets, dtype='<u8')
+        return self._offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, k):
+        return self._read(int(self.offsets[k]))[0]
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,96 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .bitboard import BitboardQuoridor
+from .quoridor import POSITION_FORMAT
+
+# Layout of the shared block: the number of positions ever written (int64),
+# then capacity positions as Quoridor.to_bytes and capacity outcomes (int8:
+# 1 if the player to move went on to win, -1 if they lost, 0 if the game
+# was unfinished).
+COUNTER_SIZE = 8
+
+
+class ReplayBuffer:
+    """A ring buffer of positions and outcomes in shared memory.
+
+    Made by one process (create=True) and attached to by name from others,
+    for example pool workers writing their finished games. Writers share a
+    multiprocessing Lock, which is only held while claiming slots. Once
+    capacity positions have been written, the oldest are overwritten.
+    """
+
+    def __init__(self, capacity, name=None, create=True, lock=None):
+        self.capacity = capacity
+        self.lock = lock
+        self._owner = create
+        size = COUNTER_SIZE + capacity * (POSITION_FORMAT.size + 1)
+        self._memory = shared_memory.SharedMemory(name, create=create, size=size)
+
+        buffer = self._memory.buf
+        self._counter = np.ndarray(1, dtype=np.int64, buffer=buffer)
+        self.positions = np.ndarray([capacity, POSITION_FORMAT.size], dtype=np.uint8, buffer=buffer,
+                                    offset=COUNTER_SIZE)
+        self.outcomes = np.ndarray(capacity, dtype=np.int8, buffer=buffer,
+                                   offset=COUNTER_SIZE + capacity * POSITION_FORMAT.size)
+        if create:
+            self._counter[0] = 0
+
+    @property
+    def name(self):
+        return self._memory.name
+
+    @property
+    def total(self):
+        """Positions written since the buffer was made, including overwritten ones."""
+        return int(self._counter[0])
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Detaches from the block, and frees it if this is the creating process."""
+        del self._counter, self.positions, self.outcomes
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+    def add(self, positions, outcomes):
+        """Appends (n, 20) positions and their (n,) outcomes."""
+        n = len(positions)
+        if n == 0:
+            return
+        if self.lock is not None:
+            with self.lock:
+                start = self.total
+                self._counter[0] = start + n
+        else:
+            start = self.total
+            self._counter[0] = start + n
+        slots = np.arange(start, start + n) % self.capacity
+        self.positions[slots] = positions
+        self.outcomes[slots] = outcomes
+
+    def add_game(self, moves, winner):
+        """Appends every position of a game played from the start."""
+        board = BitboardQuoridor()
+        positions = np.empty([len(moves), POSITION_FORMAT.size], dtype=np.uint8)
+        players = np.empty(len(moves), dtype=np.int8)
+        for i, move in enumerate(moves):
+            positions[i] = np.frombuffer(board.to_bytes(), dtype=np.uint8)
+            players[i] = board.current_player
+            board.push(move)
+        outcomes = np.zeros(len(moves), dtype=np.int8) if winner is None else np.where(players == winner, 1, -1)
+        self.add(positions, outcomes)
+
+    def sample(self, n, rng=np.random):
+        """n random (positions, outcomes) from what the buffer holds."""
+        indices = rng.randint(0, len(self), n)
+        return self.positions[indices], self.outcomes[indices]
@@ -0,0 +1,47 @@
+from collections import OrderedDict, namedtuple
+
+# Move generation results for a position. legal_mask is a read-only length-140
+# boolean array, distances the shortest path lengths of players 1 and 2 (None
+# if a player can't reach its goal).
+Entry = namedtuple('Entry', ['legal_mask', 'distances'])
+
+
+class TranspositionCache:
+    """Bounded LRU map from Zobrist hash to move generation results.
+
+    The same position is often reached through different move orders, so
+    games and search trees can share one cache between clones.
+    """
+
+    def __init__(self, maxsize=2 ** 16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """The entry for a hash, or None if it isn't cached."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
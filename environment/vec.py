@@ -0,0 +1,177 @@
+import numpy as np
+
+from .encoder import encode_arrays
+from .floodfill import EAST_CUTS, GOALS, NORTH_CUTS, free_walls, open_edges, reachable
+from .quoridor import (DIAGONAL_JUMPS, EAST, NEIGHBOURS, NORTH, PAWN_DELTAS, SOUTH,
+                       STRAIGHT_JUMPS, WEST)
+
+N_TILES = 81
+
+# For every tile and basic direction, the index of that edge in the
+# concatenated [north, east, closed] edge array built by _edges
+CLOSED_EDGE = 2 * N_TILES
+TILE_NEIGHBOURS = np.array(NEIGHBOURS)
+EDGE_INDEX = np.full([N_TILES, 4], CLOSED_EDGE)
+for _tile, (_north, _south, _east, _west) in enumerate(NEIGHBOURS):
+    if _north >= 0:
+        EDGE_INDEX[_tile, NORTH] = _tile
+    if _south >= 0:
+        EDGE_INDEX[_tile, SOUTH] = _south
+    if _east >= 0:
+        EDGE_INDEX[_tile, EAST] = N_TILES + _tile
+    if _west >= 0:
+        EDGE_INDEX[_tile, WEST] = N_TILES + _west
+
+# The three lattice points (corners of a 10x10 grid) each wall spans. A wall
+# can only disconnect the board if at least two of them already touch
+# another wall or the border, otherwise it can't close a loop.
+WALL_POINTS = np.zeros([128, 3], dtype=int)
+for _ix in range(64):
+    _row, _column = divmod(_ix, 8)
+    WALL_POINTS[_ix] = [(_row + 1) * 10 + _column + offset for offset in range(3)]
+    WALL_POINTS[_ix + 64] = [(_row + offset) * 10 + _column + 1 for offset in range(3)]
+
+BORDER_POINTS = np.ones([10, 10], dtype=bool)
+BORDER_POINTS[1:-1, 1:-1] = False
+
+
+class VecQuoridor:
+    """Many Quoridor games stepped in lockstep.
+
+    State is kept as arrays over games: positions (n, 2), walls (n, 64) using
+    the same 1 / -1 / 0 convention as Quoridor._intersections, walls remaining
+    (n, 2) and the current player (n,). Actions use the 140-action layout of
+    Quoridor and observations the same 25 planes as Quoridor.state. Finished
+    games are reset automatically.
+    """
+
+    def __init__(self, n_envs, safe=False):
+        self.n_envs = n_envs
+        self.safe = safe
+
+        self.action_space = 140 # 140 possible actions in total
+        self.n_players = 2
+        self.reset()
+
+    def reset(self):
+        self.positions = np.empty([self.n_envs, 2], dtype=np.int64)
+        self.walls = np.empty([self.n_envs, 64], dtype=np.int8)
+        self.walls_remaining = np.empty([self.n_envs, 2], dtype=np.int64)
+        self.current_player = np.empty(self.n_envs, dtype=np.int64)
+        self._reset_games(np.arange(self.n_envs))
+        return self.state
+
+    def _reset_games(self, games):
+        self.positions[games] = [4, 76]
+        self.walls[games] = 0
+        self.walls_remaining[games] = 10
+        self.current_player[games] = 1
+
+    @property
+    def state(self):
+        """The (n, 25, 9, 9) stack of Quoridor.state planes for every game."""
+        return encode_arrays(self.walls, self.positions, self.walls_remaining, self.current_player)
+
+    def legal_mask(self):
+        """The (n, 140) mask of valid actions in every game."""
+        mask = np.zeros([self.n_envs, self.action_space], dtype=bool)
+        north, east = open_edges(self.walls)
+        mask[:, :12] = self._valid_pawn_actions(north, east)
+        mask[:, 12:] = self._valid_wall_actions(north, east)
+        return mask
+
+    def _edges(self, north, east):
+        closed = np.zeros([self.n_envs, 1], dtype=bool)
+        return np.concatenate([north.reshape(-1, N_TILES), east.reshape(-1, N_TILES), closed], axis=1)
+
+    def _valid_pawn_actions(self, north, east):
+        games = np.arange(self.n_envs)[:, None]
+        player = self.current_player - 1
+        location = self.positions[games[:, 0], player]
+        opponent_loc = self.positions[games[:, 0], 1 - player]
+
+        edges = self._edges(north, east)
+        open_from_location = edges[games, EDGE_INDEX[location]]
+        open_from_opponent = edges[games, EDGE_INDEX[opponent_loc]]
+        facing = TILE_NEIGHBOURS[location] == opponent_loc[:, None]
+
+        valid = np.zeros([self.n_envs, 12], dtype=bool)
+        valid[:, :4] = open_from_location & ~facing
+
+        jumping = open_from_location & facing
+        # Jumping over the opponent's pawn off the board reaches the goal
+        goal_jump = np.zeros_like(jumping)
+        goal_jump[:, NORTH] = (player == 0) & (opponent_loc > 71)
+        goal_jump[:, SOUTH] = (player == 1) & (opponent_loc < 9)
+        valid[:, STRAIGHT_JUMPS] = jumping & (open_from_opponent | goal_jump)
+
+        for (direction, side), action in DIAGONAL_JUMPS.items():
+            valid[:, action] |= jumping[:, direction] & open_from_opponent[:, side]
+        return valid
+
+    def _valid_wall_actions(self, north, east):
+        games = np.arange(self.n_envs)
+        has_walls = self.walls_remaining[games, self.current_player - 1] > 0
+        valid = free_walls(self.walls) & has_walls[:, None]
+
+        # Only walls closing a loop of walls / border need a flood fill
+        walls = self.walls.reshape(-1, 8, 8)
+        points = np.broadcast_to(BORDER_POINTS, (self.n_envs, 10, 10)).copy()
+        horizontal = walls == 1
+        vertical = walls == -1
+        for offset in range(3):
+            points[:, 1:9, offset:offset + 8] |= horizontal
+            points[:, offset:offset + 8, 1:9] |= vertical
+        touching = points.reshape(-1, 100)[:, WALL_POINTS].sum(axis=-1) >= 2
+
+        candidate_games, candidate_walls = np.nonzero(valid & touching)
+        if candidate_games.size:
+            candidate_north = north[candidate_games] & ~NORTH_CUTS[candidate_walls]
+            candidate_east = east[candidate_games] & ~EAST_CUTS[candidate_walls]
+
+            start = np.zeros([2, candidate_games.size, N_TILES], dtype=bool)
+            candidates = np.arange(candidate_games.size)
+            start[0, candidates, self.positions[candidate_games, 0]] = True
+            start[1, candidates, self.positions[candidate_games, 1]] = True
+            start = start.reshape(2, -1, 9, 9)
+
+            reached = reachable(start, GOALS, candidate_north, candidate_east).all(axis=0)
+            valid[candidate_games, candidate_walls] = reached
+        return valid
+
+    def step(self, actions):
+        """Take a step in every game.
+
+        Returns the new observations, the (n, 2) rewards for players 1 and 2
+        (+1 to the winner, -1 to the loser) and which games finished. Finished games are reset, so their
+        observation is the start position of the next game.
+        """
+        actions = np.asarray(actions)
+        if self.safe:
+            legal = self.legal_mask()[np.arange(self.n_envs), actions]
+            if not legal.all():
+                raise ValueError(f"Invalid Actions: {actions[~legal]}")
+
+        games = np.arange(self.n_envs)
+        player = self.current_player - 1
+
+        pawn = actions < 12
+        deltas = np.asarray(PAWN_DELTAS)[np.where(pawn, actions, 0)]
+        self.positions[games[pawn], player[pawn]] += deltas[pawn]
+
+        wall_games = games[~pawn]
+        wall_actions = actions[~pawn] - 12
+        self.walls[wall_games, wall_actions % 64] = np.where(wall_actions < 64, 1, -1)
+        self.walls_remaining[wall_games, player[~pawn]] -= 1
+
+        # Same reward convention as Quoridor._get_rewards
+        rewards = np.zeros([self.n_envs, 2], dtype=np.int64)
+        player2_goal = self.positions[:, 1] < 9
+        player1_goal = self.positions[:, 0] > 71
+        rewards[player2_goal] = (-1, 1)
+        rewards[player1_goal & ~player2_goal] = (1, -1)
+        done = player1_goal | player2_goal
+
+        self.current_player = np.where(done, self.current_player, 3 - self.current_player)
+        self._reset_games(games[done])
+        return self.state, rewards, done
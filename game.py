@@ -1,9 +1,15 @@
+import argparse
+
+import numpy as np
 import pygame
 import logwood
 from logwood.handlers.stderr import ColoredStderrHandler
-from environment.quoridor import Quoridor
+from environment.quoridor import PAWN_DELTAS, Quoridor
+from agents.alphabeta import AlphaBetaAgent
 from agents.base import BaseAgent
 from agents.manual import ManualPygameAgent
+from agents.mcts import MCTSAgent
+from agents.runner import AgentRunner
 
 logwood.basic_config(
         level = logwood.INFO,
@@ -35,17 +41,89 @@ WALL_HEIGHT = TILE_WIDTH * 2 + WALL_WIDTH
 
 
 
+# Board geometry, built once. Tiles are indexed like Quoridor tiles (row 0 at
+# the bottom of the screen) and walls by their wall action (12-139).
+def _tile_rect(tile):
+    row, column = divmod(tile, 9)
+    return pygame.Rect((TILE_WIDTH + WALL_WIDTH) * column,
+                       (WALL_WIDTH + TILE_HEIGHT) * (8 - row),
+                       TILE_WIDTH,
+                       TILE_HEIGHT)
+
+
+def _wall_rects(action):
+    """The wall's full rectangle and the two halves that highlight it on hover."""
+    row, column = divmod((action - 12) % 64, 8)
+    if action >= 76:
+        x = TILE_WIDTH + (TILE_WIDTH + WALL_WIDTH) * column
+        y = (TILE_HEIGHT + WALL_WIDTH) * (7 - row)
+        rect = pygame.Rect(x, y, WALL_WIDTH, WALL_HEIGHT)
+        collides = (pygame.Rect(x, y + TILE_HEIGHT / 2, WALL_WIDTH, TILE_HEIGHT / 2),
+                    pygame.Rect(x, y + TILE_HEIGHT + WALL_WIDTH, WALL_WIDTH, TILE_HEIGHT / 2))
+    else:
+        x = (TILE_HEIGHT + WALL_WIDTH) * column
+        y = TILE_HEIGHT + (TILE_HEIGHT + WALL_WIDTH) * (7 - row)
+        rect = pygame.Rect(x, y, WALL_HEIGHT, WALL_WIDTH)
+        collides = (pygame.Rect(x + TILE_WIDTH / 2, y, TILE_WIDTH / 2, WALL_WIDTH),
+                    pygame.Rect(x + TILE_WIDTH + WALL_WIDTH, y, TILE_WIDTH / 2, WALL_WIDTH))
+    return rect, collides
+
+
+TILE_RECTS = [_tile_rect(tile) for tile in range(81)]
+WALL_RECTS = {}
+WALL_COLLIDES = {}
+for _action in range(12, 140):
+    WALL_RECTS[_action], WALL_COLLIDES[_action] = _wall_rects(_action)
+
+# Hit-test index: the tile and the wall action (hover areas only) under
+# every pixel of the screen, -1 where there are none. Looking up the mouse
+# is one array read, however many tiles and walls the board has.
+TILE_AT = np.full([SCREEN_HEIGHT, SCREEN_WIDTH], -1, dtype=np.int16)
+WALL_AT = np.full([SCREEN_HEIGHT, SCREEN_WIDTH], -1, dtype=np.int16)
+for _tile, _rect in enumerate(TILE_RECTS):
+    TILE_AT[_rect.top:_rect.bottom, _rect.left:_rect.right] = _tile
+for _action, _collides in WALL_COLLIDES.items():
+    for _rect in _collides:
+        WALL_AT[_rect.top:_rect.bottom, _rect.left:_rect.right] = _action
+
+# The pawn action for each tile offset, see PAWN_DELTAS
+DELTA_ACTIONS = {delta: action for action, delta in enumerate(PAWN_DELTAS)}
+
+PLAYER1_TEXT_POSITION = SCREEN_HEIGHT + 2, SCREEN_HEIGHT * 0.9
+PLAYER2_TEXT_POSITION = SCREEN_HEIGHT + 2, SCREEN_HEIGHT * 0.1
+STATUS_TEXT_POSITION = SCREEN_HEIGHT + 2, SCREEN_HEIGHT * 0.5
+
+# Computer players, by name on the command line
+COMPUTER_AGENTS = {
+    'random': BaseAgent,
+    'alphabeta': AlphaBetaAgent,
+    'mcts': MCTSAgent,
+}
+
+
 # ---- Main Program Loop ---- #
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play Quoridor")
+    choices = ['human'] + sorted(COMPUTER_AGENTS)
+    parser.add_argument('--player1', choices=choices, default='human')
+    parser.add_argument('--player2', choices=choices, default='human')
+    parser.add_argument('--think-time', type=float, default=1.0, help="seconds a computer player has per move")
+    args = parser.parse_args(argv)
+
     logger.info("Loading Game Environment")
     game = Quoridor()
-    player1 = ManualPygameAgent('Matt')
-    player2 = ManualPygameAgent('Kelsy')
 
     player_types = {1 : 'human', 2: 'human'}
-    players = {1 : player1, 2 : player2}
-
-    game.load(player1, player2)
+    players = {}
+    # Computer players search on a background thread, see AgentRunner
+    runners = {}
+    for player, (kind, name) in enumerate(((args.player1, 'Matt'), (args.player2, 'Kelsy')), start=1):
+        if kind == 'human':
+            players[player] = ManualPygameAgent(name)
+        else:
+            player_types[player] = 'computer'
+            players[player] = COMPUTER_AGENTS[kind](kind)
+            runners[player] = AgentRunner(players[player], args.think_time)
 
     logger.info("Initializing Visuals")
     pygame.init()
@@ -56,203 +134,205 @@ def main():
     pygame.display.set_caption("QUORIDOR")
 
     clock = pygame.time.Clock()
+    renderer = BoardRenderer(screen)
 
-    valid_actions = game.valid_actions
+    legal_mask = game.legal_mask()
     done = False
     while not done:
-        player_moved = False
-        pawn_moves, walls = draw_game(game, screen, valid_actions)
-        valid_walls = [wall for wall in walls if wall[2] in valid_actions]
-        if player_types[game.current_player] == 'human':
-            touch = pygame.mouse.get_pos()
-            for wall, collides, _ in valid_walls:
-                for collide in collides:
-                    if collide.collidepoint(touch):
-                        pygame.draw.rect(screen, LIGHTBROWN, wall)
-                        break
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    done = True
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    touch = pygame.mouse.get_pos()
-                    # This is messy - fix later
-                    for rect, action in pawn_moves:
-                        if rect.collidepoint(touch):
-                            players[game.current_player].receive_action(action)
-                            player_moved = True
-                            break
-                        if player_moved : break
-                    if player_moved : break
-
-                    for rect, collide_points, action in valid_walls:
-                        for collides in collide_points:
-                            if collides.collidepoint(touch):
-                                players[game.current_player].receive_action(action)
-                                player_moved = True
-                                break
-                        if player_moved == True:
-                            break
-
+        action = None
+        hover = None
+        human = game.winner is None and player_types[game.current_player] == 'human'
+        if human:
+            hover = wall_action_at(legal_mask, pygame.mouse.get_pos())
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                done = True
+            elif event.type == pygame.MOUSEBUTTONDOWN and human:
+                touch = event.pos
+                action = pawn_action_at(game, legal_mask, touch)
+                if action is None:
+                    action = wall_action_at(legal_mask, touch)
+
+        status = None
+        if game.winner is None:
+            for player, runner in runners.items():
+                if player == game.current_player:
+                    if not runner.thinking:
+                        runner.think(game)
+                    action = runner.poll()
+                    progress = runner.progress()
+                    status = f"{players[player].name}: {progress['nodes'] or 0} nodes"
+                    if progress['best_action'] is not None:
+                        status += f", best {action_label(game, progress['best_action'])}"
+                elif human:
+                    # Search on the human's time, there's no point while
+                    # another computer player needs the CPU
+                    runner.ponder(game)
+
+        renderer.draw(game, legal_mask, hover)
+        renderer.draw_status(status)
+        renderer.update()
         clock.tick(30)
-        pygame.display.flip()
-
-        if player_moved or player_types[game.current_player] == 'computer':
-            winner = game.step()
-            valid_actions = game.valid_actions
-            if winner:
-                logger.info(f"Winner is {winner.name}")
 
+        if action is not None:
+            player = players[game.current_player]
+            if human:
+                player.receive_action(action)
+                action = player.choose_action()
+            game.step(action)
+            game.legal_mask(out=legal_mask)
+            if game.winner is not None:
+                logger.info(f"Winner is {players[game.winner].name}")
+
+    for runner in runners.values():
+        runner.cancel()
     pygame.quit()
 
-def draw_game(game, screen, valid_actions):
-        # Calculate valid action tiles
-        # Draw Valid Pawn actions
-        screen.fill(BLACK)
-        pawn_actions = [action for action in valid_actions if action < 12]
-        reference_tile = game._positions[game.current_player]
-
-        action_tiles = {}
-        for action in pawn_actions:
-            if action == game._DIRECTIONS['N']:
-                action_tiles[reference_tile + 9] =  action
-            elif action == game._DIRECTIONS['S']:
-                action_tiles[reference_tile - 9] =  action
-            elif action == game._DIRECTIONS['E']:
-                action_tiles[reference_tile + 1] = action
-            elif action == game._DIRECTIONS['W']:
-                action_tiles[reference_tile - 1] = action
-            elif action == game._DIRECTIONS['NN']:
-                action_tiles[reference_tile + 18] = action
-            elif action == game._DIRECTIONS['SS']:
-                action_tiles[reference_tile - 18] = action
-            elif action == game._DIRECTIONS['EE']:
-                action_tiles[reference_tile + 2] = action
-            elif action == game._DIRECTIONS['WW']:
-                action_tiles[reference_tile - 2] = action
-            elif action == game._DIRECTIONS['NE']:
-                action_tiles[reference_tile + 10] = action
-            elif action == game._DIRECTIONS['NW']:
-                action_tiles[reference_tile + 8] = action
-            elif action == game._DIRECTIONS['SE']:
-                action_tiles[reference_tile - 8] = action
-            elif action == game._DIRECTIONS['SW']:
-                action_tiles[reference_tile - 10] = action
-
-        # Draw Tiles
-        pawn_moves = []
-        for row in range(9):
-            for column in range(9):
-                if row * 9 + column in action_tiles.keys():
-                    if game.current_player == 1:
-                        color = LIGHTBLUE
-                    else:
-                        color = LIGHTRED
-                    rect = pygame.draw.rect(
-                            screen,
-                            color,
-                            [(TILE_WIDTH + WALL_WIDTH) * column,
-                            (WALL_WIDTH + TILE_HEIGHT) * (8 - row),
-                            TILE_WIDTH,
-                            TILE_HEIGHT]
-                            )
-                    pawn_moves.append([rect, action_tiles[row * 9 + column]])
-                else:
-                    if row * 9 + column == game._positions[1]:
-                        color = BLUE
-                    elif row * 9 + column == game._positions[2]:
-                        color = RED
-                    else:
-                        color = DARKBLUE
-                    pygame.draw.rect(screen,
-                                    color,
-                                    [(TILE_WIDTH + WALL_WIDTH) * column,
-                                    (WALL_WIDTH + TILE_HEIGHT) * (8 - row),
-                                    TILE_WIDTH,
-                                    TILE_HEIGHT])
-
-        walls = []
-
-        # Draw Vertical Walls
-        placed_walls = []
-        for row in range(8):
-            for column in range(8):
-                collide_points = []
-                rect = pygame.Rect(TILE_WIDTH + (TILE_WIDTH + WALL_WIDTH) * column,
-                                  (TILE_HEIGHT + WALL_WIDTH) * (7 - row),
-                                  WALL_WIDTH,
-                                  WALL_HEIGHT)
-                if game._intersections[row * 8 + column] == -1:
-                    placed_walls.append(rect)
-                else:
-                    # Collide rectangles for highlighting the walls on hover
-                    collide_top = pygame.Rect(TILE_WIDTH + (TILE_WIDTH + WALL_WIDTH) * column,
-                                             (TILE_HEIGHT + WALL_WIDTH) * (7 - row) + TILE_HEIGHT / 2,
-                                             WALL_WIDTH,
-                                             TILE_HEIGHT / 2)
-                    pygame.draw.rect(screen, BLACK, collide_top)
-                    collide_points.append(collide_top)
-
-                    collide_bottom = pygame.Rect(TILE_WIDTH + (TILE_WIDTH + WALL_WIDTH) * column,
-                                                (TILE_HEIGHT + WALL_WIDTH) * (7 - row) + TILE_HEIGHT + WALL_WIDTH,
-                                                WALL_WIDTH,
-                                                TILE_HEIGHT / 2)
-                    pygame.draw.rect(screen, BLACK, collide_bottom)
-                    collide_points.append(collide_bottom)
-
-                pygame.draw.rect(screen, BLACK, rect)
-                walls.append([rect, collide_points, row * 8 + column + 64 + 12])
-
-        # Draw Horizontal Walls
-        for row in range(8):
-            for column in range(8):
-                rect = pygame.Rect((TILE_HEIGHT + WALL_WIDTH) * column,
-                                    TILE_HEIGHT + (TILE_HEIGHT + WALL_WIDTH) * (7 - row),
-                                    WALL_HEIGHT,
-                                    WALL_WIDTH)
-                if game._intersections[row * 8 + column] == 1:
-                    placed_walls.append(rect)
-                else:
-                    # Collide rectangles for highlighting the walls on hover
-                    collide_points = []
-
-                    collide_left = pygame.Rect((TILE_HEIGHT + WALL_WIDTH) * column + TILE_WIDTH / 2,
-                                             TILE_HEIGHT + (TILE_HEIGHT + WALL_WIDTH) * (7 - row),
-                                             TILE_WIDTH / 2,
-                                             WALL_WIDTH)
-
-                    pygame.draw.rect(screen, BLACK, collide_left)
-                    collide_points.append(collide_left)
-
-                    collide_right = pygame.Rect((TILE_HEIGHT + WALL_WIDTH) * column + TILE_WIDTH + WALL_WIDTH,
-                                                 TILE_HEIGHT + (TILE_HEIGHT + WALL_WIDTH) * (7 - row),
-                                                 TILE_WIDTH / 2,
-                                                 WALL_WIDTH)
-                    pygame.draw.rect(screen, BLACK, collide_right)
-                    collide_points.append(collide_right)
-
-                rect = pygame.Rect((TILE_HEIGHT + WALL_WIDTH) * (column),
-                                    TILE_HEIGHT + (TILE_HEIGHT + WALL_WIDTH) * (7 - row),
-                                    WALL_HEIGHT,
-                                    WALL_WIDTH)
-
-                pygame.draw.rect(screen, BLACK, rect)
-                walls.append([rect, collide_points, row * 8 + column + 12])
-
-        for wall in placed_walls:
-            pygame.draw.rect(screen, BROWN, wall)
-
-        # Draw Walls Remaining
-        font = pygame.font.SysFont("arial", 18)
-
-        player1_walls = font.render(f"Walls Remaining: {game._player1_walls_remaining}", 1, BLUE)
-        player1_text_position = SCREEN_HEIGHT + 2, SCREEN_HEIGHT * 0.9
-
-        player2_walls = font.render(f"Walls Remaining: {game._player2_walls_remaining}", 1, RED)
-        player2_text_position = SCREEN_HEIGHT + 2, SCREEN_HEIGHT * 0.1
-
-        screen.blit(player1_walls, player1_text_position)
-        screen.blit(player2_walls, player2_text_position)
-        return pawn_moves, walls
+
+def pawn_action_at(game, legal_mask, point):
+    """The legal pawn action whose target tile is under point, or None."""
+    x, y = point
+    if not (0 <= x < SCREEN_WIDTH and 0 <= y < SCREEN_HEIGHT) or TILE_AT[y, x] < 0:
+        return None
+    # A legal action's target is always the tile it was clicked on
+    action = DELTA_ACTIONS.get(int(TILE_AT[y, x]) - game._positions[game.current_player])
+    return action if action is not None and legal_mask[action] else None
+
+
+def wall_action_at(legal_mask, point):
+    """The legal wall action whose hover area is under point, or None."""
+    x, y = point
+    if not (0 <= x < SCREEN_WIDTH and 0 <= y < SCREEN_HEIGHT):
+        return None
+    action = int(WALL_AT[y, x])
+    return action if action >= 0 and legal_mask[action] else None
+
+
+def action_label(game, action):
+    """Short text for an action, like 'NE' or 'H wall 27'."""
+    if action < 12:
+        return next(name for name, direction in game._DIRECTIONS.items() if direction == action)
+    return f"{'H' if action < 76 else 'V'} wall {(action - 12) % 64}"
+
+
+class BoardRenderer:
+    """Draws a game onto a screen, redrawing only what changed since the last frame.
+
+    The empty board is drawn once onto a background surface. Each draw
+    compares the game with what is already on screen and repaints only the
+    tiles, walls and text that differ, collecting their rectangles for
+    update to pass to pygame.display.update. A frame where nothing changed
+    costs almost nothing.
+    """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.font = pygame.font.SysFont("arial", 18)
+        self.background = pygame.Surface(screen.get_size())
+        self.background.fill(BLACK)
+        for rect in TILE_RECTS:
+            pygame.draw.rect(self.background, DARKBLUE, rect)
+
+        # Wall counts text by (player, walls remaining)
+        self._texts = {}
+        self.reset()
+
+    def reset(self):
+        """Forget what's on screen, the next draw repaints everything."""
+        self.screen.blit(self.background, (0, 0))
+        self._tiles = [DARKBLUE] * 81
+        self._walls = set()
+        self._hover = None
+        self._walls_remaining = {1: None, 2: None}
+        self._status = None
+        self._dirty = [self.screen.get_rect()]
+
+    def draw(self, game, legal_mask, hover=None):
+        """Brings the screen up to date with the game, highlighting the wall action hover."""
+        walls = {12 + ix + (64 if orientation == game.VERTICAL else 0)
+                 for ix, orientation in enumerate(game._intersections.tolist()) if orientation}
+        if not self._walls <= walls:
+            # Walls were taken back, start again from the empty board
+            self.reset()
+
+        if hover != self._hover:
+            if self._hover is not None:
+                self._restore(WALL_RECTS[self._hover])
+            if hover is not None:
+                self._paint(LIGHTBROWN, WALL_RECTS[hover])
+            self._hover = hover
+
+        for action in walls - self._walls:
+            self._paint(BROWN, WALL_RECTS[action])
+        self._walls = walls
+
+        colours = self._tile_colours(game, legal_mask)
+        for tile, colour in enumerate(colours):
+            if colour != self._tiles[tile]:
+                self._paint(colour, TILE_RECTS[tile])
+        self._tiles = colours
+
+        for player, colour, position in ((1, BLUE, PLAYER1_TEXT_POSITION), (2, RED, PLAYER2_TEXT_POSITION)):
+            remaining = game._player1_walls_remaining if player == 1 else game._player2_walls_remaining
+            if remaining != self._walls_remaining[player]:
+                self._draw_text(player, remaining, colour, position)
+
+    def draw_status(self, status):
+        """Shows a line of status text, or clears it for None."""
+        if status == self._status:
+            return
+        if self._status is not None:
+            self._restore(self._status_text.get_rect(topleft=STATUS_TEXT_POSITION))
+        if status is not None:
+            self._status_text = self.font.render(status, 1, WHITE)
+            self._dirty.append(self.screen.blit(self._status_text, STATUS_TEXT_POSITION))
+        self._status = status
+
+    def update(self):
+        """Pushes the changed parts of the screen to the display."""
+        if self._dirty:
+            pygame.display.update(self._dirty)
+            self._dirty = []
+
+    def _tile_colours(self, game, legal_mask):
+        colours = [DARKBLUE] * 81
+        # A pawn that has jumped off the board to win isn't drawn
+        for player, colour in ((1, BLUE), (2, RED)):
+            if 0 <= game._positions[player] < 81:
+                colours[game._positions[player]] = colour
+
+        if game.winner is None:
+            location = game._positions[game.current_player]
+            highlight = LIGHTBLUE if game.current_player == 1 else LIGHTRED
+            for action in range(12):
+                target = location + PAWN_DELTAS[action]
+                if legal_mask[action] and 0 <= target < 81:
+                    colours[target] = highlight
+        return colours
+
+    def _paint(self, colour, rect):
+        self._dirty.append(pygame.draw.rect(self.screen, colour, rect))
+
+    def _restore(self, rect):
+        """Repaints an area from the background, along with any placed wall over it."""
+        self.screen.blit(self.background, rect, rect)
+        self._dirty.append(rect)
+        for action in self._walls:
+            if WALL_RECTS[action].colliderect(rect):
+                pygame.draw.rect(self.screen, BROWN, WALL_RECTS[action])
+
+    def _draw_text(self, player, remaining, colour, position):
+        key = player, remaining
+        if key not in self._texts:
+            self._texts[key] = self.font.render(f"Walls Remaining: {remaining}", 1, colour)
+        text = self._texts[key]
+
+        previous = self._walls_remaining[player]
+        if previous is not None:
+            self._restore(self._texts[player, previous].get_rect(topleft=position))
+        self._dirty.append(self.screen.blit(text, position))
+        self._walls_remaining[player] = remaining
 
 
 def draw_load_screen(screen):